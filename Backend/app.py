@@ -14,6 +14,12 @@ app.config.update(
     PERMANENT_SESSION_LIFETIME=86400 # Время жизни сессии в секундах (24 часа)
 )
 
+# За прокси (Render) remote_addr - адрес прокси; клиентский берем из X-Forwarded-For,
+# доверяя только TRUSTED_PROXIES последним звеньям цепочки
+if Config.TRUSTED_PROXIES:
+    from werkzeug.middleware.proxy_fix import ProxyFix
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=Config.TRUSTED_PROXIES, x_proto=Config.TRUSTED_PROXIES)
+
 # Инициализация расширений
 from models.db import db
 db.init_app(app)
@@ -27,6 +33,7 @@ CORS(
     ],
     supports_credentials=True,
     allow_headers=["Content-Type", "Authorization", "X-Requested-With"],
+    expose_headers=["X-Next-Cursor", "Link", "ETag", "Last-Modified"],
     methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"]
 )
 
@@ -69,6 +76,28 @@ favorite_service = FavoriteService()
 avatar_service = AvatarService(use_imgbb=Config.USE_IMGBB)
 recipe_service = RecipeService(use_imgbb=Config.USE_IMGBB)
 
+# Индексы в памяти строим при старте воркера, а не на первом запросе
+try:
+    with app.app_context():
+        recipe_service.suggestions.build()
+        if Config.RECIPE_SEARCH_BACKEND == 'memory':
+            recipe_service.recipe_index.build()
+        if Config.RECIPE_BITMAP_INDEX:
+            recipe_service.bitmaps.build()
+except Exception as e:
+    print(f"WARNING: In-memory recipe indexes not built at startup: {e}")
+# Перестройка по RECIPE_SEARCH_INDEX_REFRESH - в фоне, не на потоке запроса
+for index in recipe_service.listeners:
+    index.start(app)
+
+# Просмотры пишутся в БД пачками из фонового потока
+recipe_service.views.start(app)
+
+# Плановая сверка денормализованных счетчиков (см. reconcile_counters.py)
+if Config.RECIPE_RECONCILE_INTERVAL:
+    from services.reconcile_service import ReconcileService
+    ReconcileService().start_schedule(app, Config.RECIPE_RECONCILE_INTERVAL, Config.RECIPE_RECONCILE_BATCH_SIZE)
+
 # Инициализация контроллеров
 auth_controller = AuthController(auth_service, favorite_service)
 # После инициализации сервисов
@@ -266,6 +295,11 @@ def init_database():
                 db.session.add(recipe)
             
             db.session.commit()
+            # Рецепты добавлены минуя RecipeService - связи для фильтра по ингредиентам
+            recipe_service.ingredients.backfill()
+        
+        # Полнотекстовый индекс не описан в моделях - create_all его не создает
+        recipe_service.search_service.ensure_index()
         
         return jsonify({"message": "Database initialized successfully"})
     
@@ -289,10 +323,46 @@ def create_recipe():
 def search_recipes():
     return recipe_controller.search_recipes()
 
+@app.route('/api/recipes/suggest', methods=['GET'])
+def suggest_recipes():
+    return recipe_controller.suggest_recipes()
+
+@app.route('/api/recipes/match', methods=['POST'])
+def match_recipes():
+    return recipe_controller.match_recipes()
+
+@app.route('/api/recipes/facets', methods=['GET'])
+def recipe_facets():
+    return recipe_controller.get_facets()
+
 @app.route('/api/recipes/filter', methods=['GET'])
 def filter_recipes():
     return recipe_controller.get_filtered_recipes()
 
+@app.route('/api/recipes/export', methods=['GET'])
+def export_recipes():
+    return recipe_controller.export_recipes()
+
+@app.route('/api/search/stats', methods=['GET'])
+def search_stats():
+    """Состояние индекса поиска в памяти: документы, термы, объем в байтах"""
+    return jsonify({
+        'backend': Config.RECIPE_SEARCH_BACKEND,
+        'memory_index': recipe_service.recipe_index.stats(),
+        'suggestions': recipe_service.suggestions.stats(),
+        'bitmaps': recipe_service.bitmaps.stats(),
+        'pantry': recipe_service.pantry.stats(),
+    })
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Статистика кэша рецептов (попадания, промахи, вытеснения) и single-flight"""
+    stats = recipe_service.cache.stats()
+    stats['singleflight'] = recipe_service.flights.stats()
+    stats['views'] = recipe_service.views.stats()
+    stats['sessions'] = dict(auth_service.sessions.stats(), backend=auth_service.sessions.name)
+    return jsonify(stats)
+
 # Маршрут для доступа к загруженным файлам
 @app.route('/uploads/recipes/<path:filename>')
 def serve_recipe_image(filename):
@@ -391,7 +461,7 @@ def update_recipe_with_steps(recipe_id):
         print(f"DEBUG: User found: {user}")
         
         if not user:
-            print(f"DEBUG: All sessions: {auth_service.sessions}")
+            print(f"DEBUG: Session store: {auth_service.sessions.name} {auth_service.sessions.stats()}")
             return jsonify({'error': 'Invalid session'}), 401
         
         # Отладочный вывод формы
@@ -421,16 +491,13 @@ def update_recipe(recipe_id):
 @app.route('/api/debug/sessions', methods=['GET'])
 def debug_sessions():
     """Отладочный маршрут для проверки сессий"""
-    return jsonify({
-        'total_sessions': len(auth_service.sessions),
-        'sessions': list(auth_service.sessions.keys())
-    })
+    # Сами id сессий не отдаем: у db/redis/signed их не перечислить, а список - готовые cookie
+    return jsonify(dict(auth_service.sessions.stats(), backend=auth_service.sessions.name))
 
 
 @app.route('/api/recipes/user/<int:user_id>', methods=['GET'])
 def get_user_recipes(user_id):
-    recipes = Recipe.query.filter_by(author_id=user_id).all()
-    return jsonify([recipe.to_dict() for recipe in recipes])
+    return recipe_controller.get_user_recipes(user_id)
 
 @app.route('/api/recipes/<int:recipe_id>', methods=['DELETE'])
 # @cross_origin(supports_credentials=True)
@@ -446,7 +513,7 @@ def delete_recipe(recipe_id):
     print(f"DELETE DEBUG: User found = {user}")  # Для отладки
     
     if not user:
-        print(f"DELETE DEBUG: Invalid session. Available sessions: {list(auth_service.sessions.keys())}")
+        print(f"DELETE DEBUG: Invalid session. Session store: {auth_service.sessions.name} {auth_service.sessions.stats()}")
         return jsonify({'error': 'Invalid session'}), 401
     
     return recipe_controller.delete_recipe(recipe_id)
@@ -589,7 +656,7 @@ def get_favorite_recipes():
     # Получаем рецепты
     recipes = Recipe.query.filter(Recipe.id.in_(favorite_ids)).all()
     
-    return jsonify([recipe.to_dict() for recipe in recipes])
+    return jsonify(Recipe.to_dict_list(recipes))
 
 # Маршрут для загрузки аватаров
 @app.route('/uploads/avatars/<path:filename>')
@@ -608,7 +675,7 @@ def get_my_recipes_test():  # ← НОВОЕ ИМЯ
     """ВРЕМЕННО: вернуть все рецепты"""
     from models.recipe import Recipe
     recipes = Recipe.query.order_by(Recipe.created_at.desc()).limit(10).all()
-    return jsonify([recipe.to_dict() for recipe in recipes])
+    return jsonify(Recipe.to_dict_list(recipes))
 
 # if __name__ == '__main__':
 #     with app.app_context():
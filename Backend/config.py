@@ -1,4 +1,5 @@
 import os
+import json
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -16,6 +17,10 @@ class Config:
         SQLALCHEMY_DATABASE_URI = SQLALCHEMY_DATABASE_URI.replace('postgres://', 'postgresql://', 1)
     
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # JSON-колонки (ingredients, instructions) храним с кириллицей как есть, без \uXXXX
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'json_serializer': lambda value: json.dumps(value, ensure_ascii=False)
+    }
     
     # ImgBB конфигурация
     IMGBB_API_KEY = os.getenv('IMGBB_API_KEY') or '0a3069d71b6782d74ef6e2d6be371d9b'
@@ -27,13 +32,62 @@ class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'dev-jwt-secret-key-change-in-production')
     
+    # Сессии: 'memory' (один процесс), 'db' (таблица user_sessions) или 'redis' - общие для воркеров;
+    # 'signed' - подписанный токен в cookie без хранения на сервере
+    SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'memory')
+    SESSION_TTL = int(os.getenv('SESSION_TTL', 7 * 24 * 3600))
+    SESSION_MAX_ENTRIES = int(os.getenv('SESSION_MAX_ENTRIES', 10000))
+    SESSION_SWEEP_INTERVAL = int(os.getenv('SESSION_SWEEP_INTERVAL', 3600))
+    SESSION_REDIS_URL = os.getenv('SESSION_REDIS_URL', 'redis://localhost:6379/1')
+    # Ключи подписи для 'signed' через запятую: первый подписывает, остальные - для ротации
+    SESSION_SIGNING_KEYS = os.getenv('SESSION_SIGNING_KEYS', '')
+    SESSION_DENYLIST_BACKEND = os.getenv('SESSION_DENYLIST_BACKEND', 'memory')  # 'memory' или 'redis'
+    
     # Environment
     ENVIRONMENT = os.getenv('ENVIRONMENT', 'development')
+    # Сколько прокси перед приложением добавляют X-Forwarded-For (Render - один); 0 - без прокси
+    TRUSTED_PROXIES = int(os.getenv('TRUSTED_PROXIES', 1))
     
     # Настройки загрузки файлов
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
     
+    # Пагинация списков рецептов (cursor + limit)
+    RECIPES_PAGE_SIZE = int(os.getenv('RECIPES_PAGE_SIZE', 50))
+    RECIPES_MAX_PAGE_SIZE = int(os.getenv('RECIPES_MAX_PAGE_SIZE', 100))
+    # Размер пачки строк (yield_per) для потоковых ответов ?stream=1 и экспорта
+    RECIPES_STREAM_CHUNK_SIZE = int(os.getenv('RECIPES_STREAM_CHUNK_SIZE', 200))
+    
+    # Кэш рецептов: L1 в процессе (LRU + TTL) и необязательный общий L2 для всех воркеров
+    RECIPE_CACHE_ENABLED = os.getenv('RECIPE_CACHE_ENABLED', 'true').lower() == 'true'
+    RECIPE_CACHE_MAX_ENTRIES = int(os.getenv('RECIPE_CACHE_MAX_ENTRIES', 1000))
+    RECIPE_CACHE_LOCAL_TTL = int(os.getenv('RECIPE_CACHE_LOCAL_TTL', 15))
+    RECIPE_CACHE_SHARED_TTL = int(os.getenv('RECIPE_CACHE_SHARED_TTL', 300))
+    RECIPE_CACHE_BACKEND = os.getenv('RECIPE_CACHE_BACKEND', '')  # '', 'redis' или 'disk'
+    RECIPE_CACHE_REDIS_URL = os.getenv('RECIPE_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    RECIPE_CACHE_DISK_PATH = os.getenv('RECIPE_CACHE_DISK_PATH', 'instance/recipe_cache.db')
+    # Просмотры копятся в памяти и пишутся в БД пачкой: раз в N секунд или по порогу
+    RECIPE_VIEWS_FLUSH_INTERVAL = float(os.getenv('RECIPE_VIEWS_FLUSH_INTERVAL', 5))
+    RECIPE_VIEWS_FLUSH_THRESHOLD = int(os.getenv('RECIPE_VIEWS_FLUSH_THRESHOLD', 500))
+    # Уникальные зрители: HyperLogLog на 2^N регистров (12 -> 4 КБ на рецепт, ошибка ~1.6%)
+    RECIPE_UNIQUE_VIEWS_PRECISION = int(os.getenv('RECIPE_UNIQUE_VIEWS_PRECISION', 12))
+    # Сверка счетчиков рецептов с comments/ratings/favorites раз в N секунд; 0 - выключено
+    RECIPE_RECONCILE_INTERVAL = int(os.getenv('RECIPE_RECONCILE_INTERVAL', 0))
+    RECIPE_RECONCILE_BATCH_SIZE = int(os.getenv('RECIPE_RECONCILE_BATCH_SIZE', 500))
+    
+    # Поиск: 'db' - полнотекстовый индекс БД, 'memory' - инвертированный индекс в процессе
+    RECIPE_SEARCH_BACKEND = os.getenv('RECIPE_SEARCH_BACKEND', 'db')
+    # Раз во сколько секунд перестраивать индекс в памяти целиком (0 - только события)
+    RECIPE_SEARCH_INDEX_REFRESH = int(os.getenv('RECIPE_SEARCH_INDEX_REFRESH', 300))
+    # Порог сходства для поиска с опечатками (0..1, как pg_trgm.similarity_threshold)
+    RECIPE_FUZZY_THRESHOLD = float(os.getenv('RECIPE_FUZZY_THRESHOLD', 0.3))
+    # Подсказки /api/recipes/suggest: сколько лучших хранить в узле дерева и отдавать максимум
+    RECIPE_SUGGEST_TOP_SIZE = int(os.getenv('RECIPE_SUGGEST_TOP_SIZE', 50))
+    RECIPE_SUGGEST_MAX_LIMIT = int(os.getenv('RECIPE_SUGGEST_MAX_LIMIT', 20))
+    # Битмап-индекс в памяти для /api/recipes/filter и /facets; '' - pyroaring если есть, иначе int
+    RECIPE_BITMAP_INDEX = os.getenv('RECIPE_BITMAP_INDEX', 'false').lower() == 'true'
+    RECIPE_BITMAP_BACKEND = os.getenv('RECIPE_BITMAP_BACKEND', '')  # '', 'roaring' или 'int'
+    
     # CORS настройки
     if ENVIRONMENT == 'production':
         CORS_ORIGINS = ['https://cookbook-backend-kupo.onrender.com']
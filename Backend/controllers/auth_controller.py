@@ -1,6 +1,7 @@
 from flask import jsonify, request
 from services.auth_service import AuthService
 from services.favorite_service import FavoriteService
+from config import Config
 
 class AuthController:
     def __init__(self, auth_service, favorite_service):
@@ -30,7 +31,8 @@ class AuthController:
             'user': user.to_dict(),
             'session_id': session_id
         })
-        response.set_cookie('session_id', session_id, httponly=True, samesite='None', secure=True,  path='/')
+        response.set_cookie('session_id', session_id, httponly=True, samesite='None', secure=True,  path='/',
+                            max_age=Config.SESSION_TTL)
         return response, 201
     
     def login(self):
@@ -49,7 +51,8 @@ class AuthController:
             'user': user.to_dict(),
             'session_id': session_id
         })
-        response.set_cookie('session_id', session_id, httponly=True, samesite='None', secure=True,  path='/')
+        response.set_cookie('session_id', session_id, httponly=True, samesite='None', secure=True,  path='/',
+                            max_age=Config.SESSION_TTL)
         return response
     
     def logout(self):
@@ -123,10 +126,18 @@ class AuthController:
         
         # Используем сервис рецептов для получения рецептов пользователя
         from services.recipe_service import RecipeService
+        from controllers.recipe_controller import list_args, paginated_response, conditional_list
         recipe_service = RecipeService()
-        recipes = recipe_service.get_user_recipes(user.id)
         
-        return jsonify([recipe.to_dict() for recipe in recipes])
+        def build_response():
+            try:
+                cursor, limit, fields = list_args()
+                recipes, next_cursor = recipe_service.get_user_recipes(user.id, cursor, limit, fields)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            return paginated_response(recipes, next_cursor, fields)
+        
+        return conditional_list(recipe_service, build_response, user.id)
     
     def toggle_favorite(self):
         """Добавить/удалить рецепт из избранного"""
@@ -142,15 +153,12 @@ class AuthController:
         if not recipe_id:
             return jsonify({'error': 'Recipe ID is required'}), 400
         
-        # Проверяем, есть ли уже в избранном
-        if self.favorite_service.is_favorite(user.id, int(recipe_id)):
-            # Удаляем из избранного
-            if self.favorite_service.remove_from_favorites(user.id, int(recipe_id)):
-                return jsonify({'message': 'Removed from favorites', 'is_favorite': False})
-        else:
-            # Добавляем в избранное
-            if self.favorite_service.add_to_favorites(user.id, int(recipe_id)):
-                return jsonify({'message': 'Added to favorites', 'is_favorite': True})
+        # Проверка и изменение - в одной транзакции вместе со счетчиком рецепта
+        is_favorite = self.favorite_service.toggle_favorite(user.id, int(recipe_id))
+        if is_favorite is True:
+            return jsonify({'message': 'Added to favorites', 'is_favorite': True})
+        if is_favorite is False:
+            return jsonify({'message': 'Removed from favorites', 'is_favorite': False})
         
         return jsonify({'error': 'Failed to update favorites'}), 500
     
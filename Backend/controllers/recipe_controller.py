@@ -1,9 +1,131 @@
-from flask import jsonify, request
+from flask import jsonify, request, Response, stream_with_context
+from urllib.parse import urlencode
+from datetime import datetime, timezone
+import hashlib
+import json
 from services.recipe_service import RecipeService
 from services.comment_service import CommentService
 from services.rating_service import RatingService
-from services.auth_service import AuthService
+from services.auth_service import AuthService, session_store
+from services.recipe_filter import RecipeFilter
 from models.db import db
+from config import Config
+from models.recipe import Recipe
+
+
+def parse_json_field(value):
+    """JSON-строку из формы превращаем в структуру для JSON-колонки; обычный текст не трогаем"""
+    if isinstance(value, str) and value.strip()[:1] in ('[', '{'):
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
+    return value
+
+
+def make_etag(*parts):
+    """Непрозрачный ETag из частей версии"""
+    return hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def is_not_modified(etag, last_modified):
+    """Проверить If-None-Match (приоритетно) / If-Modified-Since текущего запроса"""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        # HTTP-даты с точностью до секунды, updated_at хранится в UTC без tzinfo
+        modified = last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+        return modified <= request.if_modified_since
+    return False
+
+
+def conditional_response(etag, last_modified, build_response):
+    """304 Not Modified без сериализации, либо build_response() с валидаторами"""
+    if is_not_modified(etag, last_modified):
+        response = Response(status=304)
+    else:
+        response = build_response()
+        if isinstance(response, tuple):
+            return response  # ошибки отдаем без ETag
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    # Кэшировать можно, но перед использованием - всегда перепроверять
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def conditional_list(recipe_service, build_response, user_id=None):
+    """Условный GET для списков: версия коллекции + параметры запроса.
+
+    user_id - список зависит от того, кто вошел (/api/recipes/my): id входит
+    в ETag, иначе после смены аккаунта браузер получил бы 304 на чужой список.
+    """
+    last_modified, version = recipe_service.get_collection_version()
+    response = conditional_response(make_etag(request.full_path, version, user_id), last_modified, build_response)
+    if user_id is not None and not isinstance(response, tuple):
+        response.vary.add('Cookie')
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def list_args():
+    """cursor, limit и набор полей (?fields= / ?view=card) списочного запроса"""
+    fields = Recipe.parse_fields(request.args.get('fields'), request.args.get('view'))
+    return request.args.get('cursor'), request.args.get('limit'), fields
+
+
+def viewer_key():
+    """Кто смотрит рецепт - для уникальных просмотров: пользователь, иначе IP.
+
+    По пользователю, а не по cookie: новая сессия после входа - тот же зритель.
+    IP клиента за прокси Render восстанавливает ProxyFix (см. TRUSTED_PROXIES).
+    """
+    session_id = request.cookies.get('session_id')
+    user_id = session_store.get(session_id) if session_id else None
+    if user_id is not None:
+        return f'user:{user_id}'
+    return f'ip:{request.remote_addr}'
+
+
+def stream_requested():
+    """?stream=1 - отдать весь результат потоком вместо одной страницы"""
+    return request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def streamed_response(chunks, fields=None, filename=None):
+    """JSON-массив, который кодируется и отправляется по пачкам по мере чтения из БД"""
+    def generate():
+        yield '['
+        first = True
+        for chunk in chunks:
+            items = Recipe.rows_to_dicts(chunk, fields) if fields else Recipe.to_dict_list(chunk)
+            if not items:
+                continue
+            encoded = ','.join(json.dumps(item, ensure_ascii=False) for item in items)
+            yield encoded if first else ',' + encoded
+            first = False
+        yield ']'
+    
+    response = Response(stream_with_context(generate()), mimetype='application/json')
+    if filename:
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+
+def paginated_response(recipes, next_cursor, fields=None):
+    """JSON-массив страницы; курсор следующей страницы уходит в заголовки"""
+    if fields:
+        response = jsonify(Recipe.rows_to_dicts(recipes, fields))
+    else:
+        response = jsonify(Recipe.to_dict_list(recipes))
+    if next_cursor:
+        args = request.args.to_dict()
+        args['cursor'] = next_cursor
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    return response
+
 
 class RecipeController:
     def __init__(self, recipe_service, comment_service, rating_service,auth_service=None):
@@ -13,14 +135,47 @@ class RecipeController:
         self.auth_service = auth_service  # Добавляем auth_service
     
     def get_all_recipes(self):
-        recipes = self.recipe_service.get_all_recipes()
-        return jsonify([recipe.to_dict() for recipe in recipes])
+        return conditional_list(self.recipe_service, self._get_all_recipes)
+    
+    def _get_all_recipes(self):
+        try:
+            cursor, limit, fields = list_args()
+            recipes, next_cursor = self.recipe_service.get_all_recipes(
+                cursor, limit, fields, stream=stream_requested()
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if stream_requested():
+            return streamed_response(recipes, fields)
+        return paginated_response(recipes, next_cursor, fields)
+    
+    def export_recipes(self):
+        """Выгрузить весь каталог одним потоковым JSON-файлом"""
+        try:
+            _, _, fields = list_args()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        chunks, _ = self.recipe_service.get_all_recipes(fields=fields, stream=True)
+        return streamed_response(chunks, fields, filename='recipes.json')
     
     def get_recipe(self, recipe_id):
-        recipe = self.recipe_service.get_recipe_by_id(recipe_id)
-        if recipe:
-            return jsonify(recipe.to_dict())
-        return jsonify({'error': 'Recipe not found'}), 404
+        entry = self.recipe_service.get_recipe_data(recipe_id)
+        if not entry:
+            return jsonify({'error': 'Recipe not found'}), 404
+        
+        self.recipe_service.register_view(recipe_id, viewer_key())
+        # Копия: запись в кэше общая, а просмотры из буфера у каждого воркера свои
+        recipe_dict = dict(entry['recipe'])
+        recipe_dict['views'] = self.recipe_service.views_count(recipe_id, recipe_dict.get('views'))
+        recipe_dict['unique_views'] = self.recipe_service.unique_views_count(
+            recipe_id, recipe_dict.get('unique_views')
+        )
+        updated_at = recipe_dict.get('updated_at')
+        return conditional_response(
+            make_etag(entry['version']),
+            datetime.fromisoformat(updated_at) if updated_at else None,
+            lambda: jsonify(recipe_dict)
+        )
             
     def create_recipe(self):
         try:
@@ -67,15 +222,10 @@ class RecipeController:
             if not recipe_data.get('title'):
                 return jsonify({'error': 'Title is required'}), 400
             
-            # Преобразуем ingredients и instructions если нужно
-            import json
-            try:
-                if isinstance(recipe_data.get('ingredients'), (list, dict)):
-                    recipe_data['ingredients'] = json.dumps(recipe_data['ingredients'])
-                if isinstance(recipe_data.get('instructions'), (list, dict)):
-                    recipe_data['instructions'] = json.dumps(recipe_data['instructions'])
-            except:
-                pass
+            # ingredients и instructions пишем в JSON-колонки структурой, а не строкой
+            for field in ('ingredients', 'instructions'):
+                if field in recipe_data:
+                    recipe_data[field] = parse_json_field(recipe_data[field])
             
             # Создаем рецепт с пользователем
             new_recipe = self.recipe_service.add_recipe(recipe_data, user)
@@ -94,8 +244,8 @@ class RecipeController:
         try:
             recipe_data = request.get_json()
             
-            # Получаем существующий рецепт
-            recipe = self.recipe_service.get_recipe_by_id(recipe_id)
+            # Получаем существующий рецепт (не get_recipe_by_id: правка - не просмотр)
+            recipe = db.session.get(Recipe, recipe_id)
             if not recipe:
                 return jsonify({'error': 'Recipe not found'}), 404
             
@@ -103,9 +253,9 @@ class RecipeController:
             if 'title' in recipe_data:
                 recipe.title = recipe_data['title']
             if 'ingredients' in recipe_data:
-                recipe.ingredients = recipe_data['ingredients']
+                recipe.ingredients = parse_json_field(recipe_data['ingredients'])
             if 'instructions' in recipe_data:
-                recipe.instructions = recipe_data['instructions']
+                recipe.instructions = parse_json_field(recipe_data['instructions'])
             if 'cooking_time' in recipe_data:
                 recipe.cooking_time = recipe_data['cooking_time']
             if 'category' in recipe_data:
@@ -114,8 +264,12 @@ class RecipeController:
                 recipe.difficulty = recipe_data['difficulty']
             if 'image_url' in recipe_data:
                 recipe.image_url = recipe_data['image_url']
+            if 'ingredients' in recipe_data:
+                self.recipe_service.ingredients.sync_recipe(recipe)
             
             db.session.commit()
+            self.recipe_service.cache.invalidate_recipe(recipe_id)
+            self.recipe_service._notify_saved(recipe)
             return jsonify(recipe.to_dict())
         except Exception as e:
             db.session.rollback()
@@ -145,6 +299,8 @@ class RecipeController:
             servings = request.form.get('servings')
             
             print(f"DEBUG: Form data - title={title}, ingredients={ingredients[:50]}...")
+            ingredients = parse_json_field(ingredients)
+            instructions = parse_json_field(instructions)
             
             # Валидация
             if not title:
@@ -214,7 +370,8 @@ class RecipeController:
     def update_recipe_with_steps(self, recipe_id, user_id=None):
         """Обновить рецепт с изображениями шагов"""
         try:
-            recipe = self.recipe_service.get_recipe_by_id(recipe_id)
+            # Без register_view: правка не засчитывается как просмотр
+            recipe = db.session.get(Recipe, recipe_id)
             if not recipe:
                 return jsonify({'error': 'Recipe not found'}), 404
             
@@ -240,11 +397,11 @@ class RecipeController:
                 if 'difficulty' in request.form:
                     recipe_data['difficulty'] = request.form.get('difficulty')
                 if 'ingredients' in request.form:
-                    recipe_data['ingredients'] = request.form.get('ingredients')
+                    recipe_data['ingredients'] = parse_json_field(request.form.get('ingredients'))
                 if 'servings' in request.form:  # ДОБАВЛЯЕМ ЭТО
                     recipe_data['servings'] = request.form.get('servings')
                 if 'instructions' in request.form:
-                    recipe_data['instructions'] = request.form.get('instructions')
+                    recipe_data['instructions'] = parse_json_field(request.form.get('instructions'))
                 if 'remove_main_image' in request.form:
                     recipe_data['remove_main_image'] = request.form.get('remove_main_image')
             # Проверяем JSON
@@ -316,34 +473,109 @@ class RecipeController:
         return jsonify({'error': 'Recipe not found or access denied'}), 404
     
     def search_recipes(self):
+        return conditional_list(self.recipe_service, self._search_recipes)
+    
+    def _search_recipes(self):
         query = request.args.get('q', '')
         if not query:
             return jsonify({'error': 'Query parameter "q" is required'}), 400
         
-        recipes = self.recipe_service.search_recipes(query)
-        return jsonify([recipe.to_dict() for recipe in recipes])
+        try:
+            cursor, limit, fields = list_args()
+            # fuzzy=1 - сразу с опечатками, fuzzy=0 - без них; по умолчанию - если точный пуст
+            fuzzy = request.args.get('fuzzy')
+            recipes, next_cursor = self.recipe_service.search_recipes(
+                query, cursor, limit, fields, stream=stream_requested(),
+                fuzzy=None if fuzzy is None else fuzzy.lower() in ('1', 'true')
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if stream_requested():
+            return streamed_response(recipes, fields)
+        return paginated_response(recipes, next_cursor, fields)
     
-    def get_filtered_recipes(self):
-        category = request.args.get('category')
-        difficulty = request.args.get('difficulty')
-        max_cooking_time = request.args.get('max_cooking_time')
-        ingredients = request.args.get('ingredients', '')
-        exclude_ingredients = request.args.get('exclude_ingredients', '')
+    def suggest_recipes(self):
+        """Подсказки при вводе: названия, категории и ингредиенты по префиксу"""
+        prefix = request.args.get('prefix', '')
+        try:
+            limit = int(request.args.get('limit', 10))
+        except ValueError:
+            return jsonify({'error': 'Invalid limit'}), 400
+        limit = max(1, min(limit, Config.RECIPE_SUGGEST_MAX_LIMIT))
+        kinds = request.args.get('types')
+        kinds = {kind.strip() for kind in kinds.split(',')} if kinds else None
         
-        # Преобразуем строки в списки
-        include_list = [ing.strip() for ing in ingredients.split(',')] if ingredients else None
-        exclude_list = [ing.strip() for ing in exclude_ingredients.split(',')] if exclude_ingredients else None
+        response = jsonify(self.recipe_service.suggest(prefix, limit, kinds))
+        # Повторный ввод того же префикса браузер возьмет из своего кэша
+        response.cache_control.public = True
+        response.cache_control.max_age = 30
+        return response
+    
+    def match_recipes(self):
+        """Что приготовить из имеющихся продуктов: рецепты по доле покрытых ингредиентов"""
+        data = request.get_json(silent=True) or {}
+        pantry = data.get('ingredients')
+        if isinstance(pantry, str):
+            pantry = pantry.split(',')
+        if not isinstance(pantry, list) or not all(isinstance(item, str) for item in pantry):
+            return jsonify({'error': 'ingredients must be a list of strings'}), 400
+        pantry = [item.strip() for item in pantry if item.strip()]
+        if not pantry:
+            return jsonify({'error': 'ingredients is required'}), 400
         
-        # Используем расширенный метод фильтрации
-        filtered_recipes = self.recipe_service.get_recipes_by_filters(
-            category=category,
-            difficulty=difficulty,
-            max_cooking_time=max_cooking_time,
-            include_ingredients=include_list,
-            exclude_ingredients=exclude_list
-        )
+        try:
+            min_coverage = float(data.get('min_coverage') or 0)
+            if not 0 <= min_coverage <= 1:
+                raise ValueError
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid min_coverage'}), 400
         
-        return jsonify([recipe.to_dict() for recipe in filtered_recipes])
+        try:
+            fields = Recipe.parse_fields(request.args.get('fields'), request.args.get('view'))
+            recipes, matches, next_cursor = self.recipe_service.match_pantry(
+                pantry, data.get('cursor'), data.get('limit'), fields, min_coverage
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        items = Recipe.rows_to_dicts(recipes, fields) if fields else Recipe.to_dict_list(recipes)
+        for item, recipe in zip(items, recipes):
+            item['match'] = matches[recipe.id]
+        response = jsonify(items)
+        if next_cursor:
+            # POST: следующая страница - тот же запрос с cursor в теле
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+    
+    def get_facets(self):
+        return conditional_list(self.recipe_service, self._get_facets)
+    
+    def _get_facets(self):
+        """Счетчики для панели фильтров с учетом уже выбранных условий"""
+        try:
+            recipe_filter = RecipeFilter.from_args(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(self.recipe_service.get_facets(recipe_filter))
+    
+    def get_filtered_recipes(self):
+        return conditional_list(self.recipe_service, self._get_filtered_recipes)
+    
+    def _get_filtered_recipes(self):
+        # Все условия (категория, сложность, время, порции, ингредиенты, автор,
+        # рейтинг, текст) и сортировка - одним запросом к БД
+        try:
+            recipe_filter = RecipeFilter.from_args(request.args)
+            cursor, limit, fields = list_args()
+            filtered_recipes, next_cursor = self.recipe_service.filter_recipes(
+                recipe_filter, cursor, limit, fields, stream=stream_requested()
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if stream_requested():
+            return streamed_response(filtered_recipes, fields)
+        return paginated_response(filtered_recipes, next_cursor, fields)
     
     def get_comments(self, recipe_id):
         try:
@@ -397,7 +629,9 @@ class RecipeController:
         user_id = 1  # временно используем первого пользователя
         
         rating_value = data.get('rating')
-        if not rating_value or not (1 <= rating_value <= 5):
+        # Целое: балл - это еще и столбец гистограммы rating_1..rating_5.
+        # type, а не isinstance: bool - подкласс int, и true стал бы оценкой 1
+        if type(rating_value) is not int or not (1 <= rating_value <= 5):
             return jsonify({'error': 'Rating must be between 1 and 5'}), 400
         
         if self.rating_service.add_rating(recipe_id, user_id, rating_value):
@@ -406,6 +640,13 @@ class RecipeController:
     
     def get_user_recipes(self, user_id):
         """Получить рецепты пользователя"""
-        recipes = self.recipe_service.get_user_recipes(user_id)
-        return jsonify([recipe.to_dict() for recipe in recipes])
+        return conditional_list(self.recipe_service, lambda: self._get_user_recipes(user_id))
+    
+    def _get_user_recipes(self, user_id):
+        try:
+            cursor, limit, fields = list_args()
+            recipes, next_cursor = self.recipe_service.get_user_recipes(user_id, cursor, limit, fields)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return paginated_response(recipes, next_cursor, fields)
     
@@ -3,6 +3,9 @@ from models.db import db
 from models.user import User
 from models.recipe import Recipe, Rating, Comment
 from models.user import Favorite
+from services.rating_service import RatingService
+from services.favorite_service import FavoriteService
+from services.ingredient_service import IngredientService
 from datetime import datetime
 import random
 
@@ -214,6 +217,12 @@ def create_sample_data():
         db.session.commit()
         print("✅ Избранное создано!")
         
+        # Рецепты, оценки и избранное добавлены напрямую, минуя сервисы, -
+        # заполняем recipe_ingredients (фильтр по ингредиентам) и хранимые агрегаты
+        IngredientService().backfill()
+        RatingService().backfill()
+        FavoriteService().backfill()
+        
         print("\n🎉 База данных успешно заполнена!")
         print(f"📊 Статистика:")
         print(f"   👥 Пользователей: {User.query.count()}")
@@ -1,14 +1,35 @@
 from .db import db
 from datetime import datetime
 from sqlalchemy.ext.hybrid import hybrid_property  # Добавьте этот импорт
+from sqlalchemy.dialects.postgresql import JSONB
+
+# JSONB на PostgreSQL, JSON на SQLite: структура разбирается драйвером один раз
+# при чтении строки, а не json.loads на каждую сериализацию
+JSONType = db.JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), 'postgresql')
+
+# Поля, которые можно запросить у списков через ?fields=
+RECIPE_LIST_FIELDS = (
+    'id', 'title', 'ingredients', 'instructions', 'cooking_time', 'category',
+    'difficulty', 'image_url', 'author', 'author_id', 'servings', 'rating',
+    'rating_count', 'views', 'unique_views', 'likes', 'comments_count', 'favorites_count',
+    'created_at', 'updated_at', 'step_images'
+)
+# ?view=card - только то, что рисует RecipeCard.js (без ingredients/instructions/step_images)
+RECIPE_CARD_FIELDS = (
+    'id', 'title', 'image_url', 'cooking_time', 'category', 'difficulty',
+    'author', 'author_id', 'servings', 'rating', 'rating_count', 'views',
+    'likes', 'comments_count', 'favorites_count', 'created_at'
+)
+# Поля не из таблицы recipes - догружаются сгруппированными запросами
+RECIPE_COMPUTED_FIELDS = ('step_images',)
 
 class Recipe(db.Model):
     __tablename__ = 'recipes'
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
-    ingredients = db.Column(db.Text, nullable=False)
-    instructions = db.Column(db.Text)
+    ingredients = db.Column(JSONType, nullable=False)
+    instructions = db.Column(JSONType)
     cooking_time = db.Column(db.Integer, default=0)
     category = db.Column(db.String(100))
     difficulty = db.Column(db.String(50), default='Легкий')
@@ -19,31 +40,35 @@ class Recipe(db.Model):
     # Статистика
     rating = db.Column(db.Float, default=0.0)
     rating_count = db.Column(db.Integer, default=0)
+    # Сумма оценок и число оценок каждого балла - rating пересчитывается без чтения ratings
+    rating_sum = db.Column(db.Integer, default=0)
+    rating_1 = db.Column(db.Integer, default=0)
+    rating_2 = db.Column(db.Integer, default=0)
+    rating_3 = db.Column(db.Integer, default=0)
+    rating_4 = db.Column(db.Integer, default=0)
+    rating_5 = db.Column(db.Integer, default=0)
     views = db.Column(db.Integer, default=0)
+    # Оценка уникальных зрителей по HyperLogLog (recipe_view_sketches), обновляется при сбросе буфера
+    unique_views = db.Column(db.Integer, default=0)
     likes = db.Column(db.Integer, default=0)
     comments_count = db.Column(db.Integer, default=0)
+    # Поддерживается FavoriteService в той же транзакции, что и строка favorites
+    favorites_count = db.Column(db.Integer, default=0)
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    @property
-    def favorites_count(self):
-        """Геттер: получить количество добавлений в избранное"""
-        if hasattr(self, '_favorites_count_cache'):
-            return self._favorites_count_cache
-        
-        # Ленивая загрузка при первом обращении
-        from models.user import Favorite
-        count = Favorite.query.filter_by(recipe_id=self.id).count()
-        
-        self._favorites_count_cache = count
-        return self._favorites_count_cache
+    # Индексы под keyset-пагинацию списков (ORDER BY created_at DESC, id DESC)
+    __table_args__ = (
+        db.Index('ix_recipes_created_at_id', 'created_at', 'id'),
+        db.Index('ix_recipes_author_id_created_at', 'author_id', 'created_at', 'id'),
+        # max(updated_at) - версия коллекции для ETag списков
+        db.Index('ix_recipes_updated_at', 'updated_at'),
+        # /api/recipes/filter: категория с сортировкой по новизне, диапазон времени
+        db.Index('ix_recipes_category_created_at', 'category', 'created_at', 'id'),
+        db.Index('ix_recipes_cooking_time', 'cooking_time'),
+    )
     
-    @favorites_count.setter
-    def favorites_count(self, value):
-        """Сеттер: установить кэшированное количество избранного"""
-        self._favorites_count_cache = value
-
     @property
     def step_images_list(self):
         """Геттер: получить список изображений шагов"""
@@ -64,31 +89,109 @@ class Recipe(db.Model):
         """Сеттер: установить кэшированные изображения шагов"""
         self._step_images_cache = value
     
-    def to_dict(self):
-        import json
-        ingredients = self.ingredients
-        instructions = self.instructions
+    @staticmethod
+    def _step_images_by_recipe(recipe_ids):
+        """{recipe_id: [изображения шагов]} одним запросом"""
+        step_images = {recipe_id: [] for recipe_id in recipe_ids}
+        images = RecipeStepImage.query.filter(
+            RecipeStepImage.recipe_id.in_(recipe_ids)
+        ).order_by(RecipeStepImage.recipe_id, RecipeStepImage.step_index).all()
+        for image in images:
+            step_images[image.recipe_id].append(image.to_dict())
+        return step_images
+    
+    @classmethod
+    def preload_related(cls, recipes):
+        """Заполнить кэш step_images_list для списка рецептов.
         
-        # Пытаемся парсить как JSON
-        try:
-            if ingredients.startswith('[') or ingredients.startswith('{'):
-                ingredients = json.loads(ingredients)
-        except:
-            pass  # Оставляем как строку если не JSON
+        Вместо запроса на каждый рецепт - один запрос к recipe_step_images
+        на весь список.
+        """
+        recipe_ids = [recipe.id for recipe in recipes]
+        if not recipe_ids:
+            return recipes
         
-        try:
-            if instructions.startswith('[') or instructions.startswith('{'):
-                instructions = json.loads(instructions)
-        except:
-            pass  # Оставляем как строку если не JSON
+        step_images = cls._step_images_by_recipe(recipe_ids)
+        
+        for recipe in recipes:
+            recipe.step_images_list = step_images[recipe.id]
+        return recipes
+    
+    @classmethod
+    def to_dict_list(cls, recipes):
+        """Сериализовать список рецептов с постоянным числом запросов"""
+        return [recipe.to_dict() for recipe in cls.preload_related(recipes)]
+    
+    @staticmethod
+    def parse_fields(fields=None, view=None):
+        """Набор полей списка из ?fields=a,b / ?view=card; None - полный to_dict()"""
+        if view == 'card':
+            return RECIPE_CARD_FIELDS
+        if view and view != 'full':
+            raise ValueError('Invalid view')
+        if not fields:
+            return None
+        
+        requested = tuple(dict.fromkeys(f.strip() for f in fields.split(',') if f.strip()))
+        unknown = [field for field in requested if field not in RECIPE_LIST_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        return requested or None
+    
+    @classmethod
+    def columns_for(cls, fields, extra=()):
+        """Колонки для SELECT под набор полей; id, created_at и extra нужны курсору всегда"""
+        names = dict.fromkeys(('id', 'created_at') + tuple(extra) + tuple(fields))
+        return [getattr(cls, name) for name in names if name not in RECIPE_COMPUTED_FIELDS]
+    
+    @classmethod
+    def rows_to_dicts(cls, rows, fields):
+        """Сериализовать строки проекции (см. columns_for) только с запрошенными полями"""
+        recipe_ids = [row.id for row in rows]
+        step_images = {}
+        if recipe_ids and 'step_images' in fields:
+            step_images = cls._step_images_by_recipe(recipe_ids)
+        
+        result = []
+        for row in rows:
+            item = {}
+            for field in fields:
+                if field == 'favorites_count':
+                    item[field] = row.favorites_count or 0
+                elif field == 'step_images':
+                    item[field] = step_images.get(row.id, [])
+                elif field == 'rating':
+                    item[field] = round(row.rating, 1) if row.rating else 0.0
+                elif field in ('created_at', 'updated_at'):
+                    value = getattr(row, field)
+                    item[field] = value.isoformat() if value else None
+                else:
+                    item[field] = getattr(row, field)
+            result.append(item)
+        return result
+    
+    @property
+    def rating_histogram(self):
+        """{'1': n, ..., '5': n} - сколько раз поставили каждый балл"""
+        return {str(stars): getattr(self, f'rating_{stars}') or 0 for stars in range(1, 6)}
+    
+    def etag_source(self):
+        """Строка версии рецепта для ETag: updated_at и счетчики.
         
+        views не входит: он растет на каждом чтении и сделал бы ETag бесполезным.
+        """
+        updated_at = self.updated_at.isoformat() if self.updated_at else ''
+        return (f'{self.id}-{updated_at}-{self.likes}-{self.comments_count}-'
+                f'{self.rating}-{self.rating_count}-{self.favorites_count}')
+    
+    def to_dict(self):
         # ДЕБАГ: Проверяем image_url
         print(f"DEBUG [Recipe.to_dict]: id={self.id}, image_url={self.image_url}")
         return {
             'id': self.id,
             'title': self.title,
-            'ingredients': ingredients,
-            'instructions': instructions,
+            'ingredients': self.ingredients,
+            'instructions': self.instructions,
             'cooking_time': self.cooking_time,
             'category': self.category,
             'difficulty': self.difficulty,
@@ -98,10 +201,12 @@ class Recipe(db.Model):
             'servings': self.servings,  # Добавляем servings в ответ API
             'rating': round(self.rating, 1) if self.rating else 0.0,
             'rating_count': self.rating_count,
+            'rating_histogram': self.rating_histogram,
             'views': self.views,
+            'unique_views': self.unique_views or 0,
             'likes': self.likes,
             'comments_count': self.comments_count,
-            'favorites_count': self.favorites_count,  # Добавляем счетчик избранного
+            'favorites_count': self.favorites_count or 0,  # Добавляем счетчик избранного
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
             'step_images': self.step_images_list #[]
@@ -116,7 +221,11 @@ class Rating(db.Model):
     rating = db.Column(db.Integer, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    __table_args__ = (db.UniqueConstraint('user_id', 'recipe_id', name='unique_user_recipe_rating'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'recipe_id', name='unique_user_recipe_rating'),
+        # Пересчет агрегатов оценок группирует по recipe_id
+        db.Index('ix_ratings_recipe_id', 'recipe_id', 'rating'),
+    )
 
 class Comment(db.Model):
     __tablename__ = 'comments'
@@ -131,6 +240,9 @@ class Comment(db.Model):
     user = db.relationship('User', backref='comments')
     recipe = db.relationship('Recipe', backref='comments')
     
+    # Комментарии рецепта и пересчет comments_count
+    __table_args__ = (db.Index('ix_comments_recipe_id', 'recipe_id', 'created_at'),)
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -142,6 +254,15 @@ class Comment(db.Model):
         }
     
 
+class RecipeViewSketch(db.Model):
+    """HyperLogLog-скетч зрителей рецепта (см. services/hyperloglog.py), сжатые регистры"""
+    __tablename__ = 'recipe_view_sketches'
+    
+    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.id', ondelete='CASCADE'), primary_key=True)
+    sketch = db.Column(db.LargeBinary, nullable=False)  # bytea / BLOB
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
 class RecipeStepImage(db.Model):
     __tablename__ = 'recipe_step_images'
     
@@ -161,4 +282,32 @@ class RecipeStepImage(db.Model):
             'step_index': self.step_index,
             'image_url': self.image_url,
             'created_at': self.created_at.isoformat() if self.created_at else None
-        }
\ No newline at end of file
+        }
+
+
+class Ingredient(db.Model):
+    """Словарь ингредиентов: одно каноническое название на продукт"""
+    __tablename__ = 'ingredients'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # Нормализованное: нижний регистр, ё -> е, без лишних пробелов
+    name = db.Column(db.String(200), unique=True, nullable=False)
+
+
+class RecipeIngredient(db.Model):
+    """Ингредиент рецепта, разобранный из JSON при записи - для индексных фильтров"""
+    __tablename__ = 'recipe_ingredients'
+    
+    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.id', ondelete='CASCADE'), primary_key=True)
+    ingredient_id = db.Column(db.Integer, db.ForeignKey('ingredients.id'), primary_key=True)
+    qty = db.Column(db.String(50))
+    unit = db.Column(db.String(50))
+    position = db.Column(db.Integer, default=0)
+    
+    recipe = db.relationship('Recipe', backref=db.backref('ingredient_links', lazy=True, cascade='all, delete-orphan'))
+    ingredient = db.relationship('Ingredient')
+    
+    __table_args__ = (
+        # PK (recipe_id, ingredient_id) - ингредиенты рецепта; этот - рецепты с ингредиентом
+        db.Index('ix_recipe_ingredients_ingredient_id', 'ingredient_id', 'recipe_id'),
+    )
@@ -42,4 +42,19 @@ class Favorite(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Уникальная пара пользователь-рецепт
-    __table_args__ = (db.UniqueConstraint('user_id', 'recipe_id', name='unique_user_recipe'),)
\ No newline at end of file
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'recipe_id', name='unique_user_recipe'),
+        # Пересчет recipes.favorites_count и удаление рецепта ищут по recipe_id
+        db.Index('ix_favorites_recipe_id', 'recipe_id'),
+    )
+
+
+class UserSession(db.Model):
+    """Серверная сессия для SESSION_BACKEND=db (см. services/session_store.py)"""
+    __tablename__ = 'user_sessions'
+    
+    id = db.Column(db.String(64), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Чистка просроченных идет по индексу, без полного прохода по таблице
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
@@ -0,0 +1,37 @@
+# Backend/reconcile_counters.py
+# Сверка денормализованных счетчиков recipes (comments_count, favorites_count,
+# rating*, views, likes) с исходными таблицами; исправляются только разошедшиеся строки.
+# Запуск: python reconcile_counters.py [--dry-run] [--batch-size N]
+import argparse
+import sys
+from app import app
+from config import Config
+from services.reconcile_service import ReconcileService
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сверка счетчиков рецептов')
+    parser.add_argument('--dry-run', action='store_true', help='только отчет, без исправлений')
+    parser.add_argument('--batch-size', type=int, default=Config.RECIPE_RECONCILE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    with app.app_context():
+        service = ReconcileService()
+        with service.exclusive() as acquired:
+            if not acquired:
+                print("Сверка уже идет в другом процессе")
+                sys.exit(1)
+            report = service.reconcile(args.batch_size, dry_run=args.dry_run)
+
+    print(f"Проверено рецептов: {report['checked']}")
+    print(f"{'Разошлось' if args.dry_run else 'Исправлено'}: {report['drifted']}")
+    for column, count in sorted(report['columns'].items()):
+        print(f"  {column}: {count}")
+    for change in report['changes']:
+        print(f"  #{change['recipe_id']} {change['column']}: {change['stored']} -> {change['expected']}")
+    if report['drifted'] > len({change['recipe_id'] for change in report['changes']}):
+        print("  ...")
+
+
+if __name__ == '__main__':
+    main()
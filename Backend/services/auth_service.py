@@ -1,14 +1,13 @@
-import uuid
 from models.db import db
 from models.user import User
+from services.session_store import create_session_store
+
+# Одно хранилище на процесс; бэкенд - Config.SESSION_BACKEND
+session_store = create_session_store()
 
-session_store = {}
 class AuthService:
     def __init__(self):
-        self.sessions = session_store  # Простое хранилище сессий
-    
-    def _generate_session_id(self):
-        return str(uuid.uuid4())
+        self.sessions = session_store
     
     def register_user(self, username, email, password):
         # Проверяем существующего пользователя
@@ -60,8 +59,7 @@ class AuthService:
             db.session.add(new_user)
             db.session.commit()
             
-            session_id = self._generate_session_id()
-            self.sessions[session_id] = new_user.id
+            session_id = self.sessions.issue(new_user.id)
             return new_user, session_id, None
         except Exception as e:
             db.session.rollback()
@@ -71,21 +69,21 @@ class AuthService:
         user = User.query.filter_by(username=username).first()
         
         if user and user.check_password(password):
-            session_id = self._generate_session_id()
-            self.sessions[session_id] = user.id
+            session_id = self.sessions.issue(user.id)
             return user, session_id, None
         
         return None, None, "Invalid username or password"
     
     def get_current_user(self, session_id):
-        if session_id in self.sessions:
-            user_id = self.sessions[session_id]
-            return User.query.get(user_id)
-        return None
+        if not session_id:
+            return None
+        user_id = self.sessions.get(session_id)
+        if user_id is None:
+            return None
+        return db.session.get(User, user_id)
     
     def logout_user(self, session_id):
-        if session_id in self.sessions:
-            del self.sessions[session_id]
+        self.sessions.delete(session_id)
     
     def get_user_by_id(self, user_id):
         return User.query.get(user_id)
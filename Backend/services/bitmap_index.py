@@ -0,0 +1,322 @@
+import threading
+from bisect import bisect_left
+from datetime import datetime
+from config import Config
+from services.facet_service import COOKING_TIME_BUCKETS
+from services.ingredient_service import canonical_name
+from services.pagination import NEWEST, parse_limit, fetch_in_order
+from services.text_index import RecipeIndex, ingredient_names
+
+
+class IntBitmaps:
+    """Битовые множества на int: бит N - рецепт с порядковым номером N"""
+
+    name = 'int'
+
+    def empty(self):
+        return 0
+
+    def with_bit(self, bitmap, ordinal):
+        return bitmap | (1 << ordinal)
+
+    def without_bit(self, bitmap, ordinal):
+        return bitmap & ~(1 << ordinal)
+
+    def copy(self, bitmap):
+        return bitmap  # int неизменяемый
+
+    def difference(self, bitmap, other):
+        return bitmap & ~other
+
+    def below(self, bitmap, ordinal):
+        """Только номера меньше ordinal"""
+        return bitmap & ((1 << ordinal) - 1)
+
+    def count(self, bitmap):
+        return bitmap.bit_count()
+
+    def descending(self, bitmap):
+        while bitmap:
+            ordinal = bitmap.bit_length() - 1
+            yield ordinal
+            bitmap ^= 1 << ordinal
+
+
+class RoaringBitmaps:
+    """Сжатые битовые множества pyroaring (необязательная зависимость)"""
+
+    name = 'roaring'
+
+    def __init__(self):
+        from pyroaring import BitMap
+        self.BitMap = BitMap
+
+    def empty(self):
+        return self.BitMap()
+
+    def with_bit(self, bitmap, ordinal):
+        bitmap.add(ordinal)
+        return bitmap
+
+    def without_bit(self, bitmap, ordinal):
+        bitmap.discard(ordinal)
+        return bitmap
+
+    def copy(self, bitmap):
+        return self.BitMap(bitmap)
+
+    def difference(self, bitmap, other):
+        return bitmap - other
+
+    def below(self, bitmap, ordinal):
+        return bitmap & self.BitMap(range(ordinal))
+
+    def count(self, bitmap):
+        return len(bitmap)
+
+    def descending(self, bitmap):
+        return reversed(bitmap)
+
+
+def bitmap_backend(name=None):
+    """pyroaring, если установлен (или явно запрошен), иначе int"""
+    name = name if name is not None else Config.RECIPE_BITMAP_BACKEND
+    if name in ('', 'roaring'):
+        try:
+            return RoaringBitmaps()
+        except ImportError:
+            if name == 'roaring':
+                print("WARNING: pyroaring is not installed, using int bitmaps")
+    return IntBitmaps()
+
+
+class BitmapIndex:
+    """Битовые индексы по значениям полей рецептов.
+
+    Рецепт получает плотный порядковый номер в порядке (created_at, id), так что
+    обход битов от старшего к младшему - это выдача "от новых к старым".
+    Номер сохраняется при изменении рецепта; номера удаленных освобождаются
+    только при полной перестройке.
+    """
+
+    FIELDS = ('category', 'difficulty', 'cooking_time', 'servings', 'author_id', 'ingredient')
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.all = backend.empty()
+        self.bitmaps = {field: {} for field in self.FIELDS}  # поле -> значение -> битмап
+        self._ordinals = {}    # recipe_id -> номер
+        self._recipe_ids = []  # номер -> recipe_id (None у удаленных)
+        self._keys = []        # номер -> (created_at, id)
+        self._values = {}      # номер -> [(поле, значение)] для снятия битов
+        self.ordered = True    # _keys отсортированы - курсор переводится в номер bisect'ом
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._ordinals)
+
+    def add(self, recipe_id, document):
+        with self._lock:
+            ordinal = self._ordinals.get(recipe_id)
+            if ordinal is None:
+                ordinal = len(self._recipe_ids)
+                key = (document['created_at'] or datetime.min, recipe_id)
+                if self._keys and key < self._keys[-1]:
+                    self.ordered = False
+                self._ordinals[recipe_id] = ordinal
+                self._recipe_ids.append(recipe_id)
+                self._keys.append(key)
+                self.all = self.backend.with_bit(self.all, ordinal)
+            else:
+                self._clear(ordinal)
+
+            values = [(field, document[field]) for field in self.FIELDS if field != 'ingredient']
+            values += [('ingredient', name) for name in document['ingredients']]
+            values = [(field, value) for field, value in values if value is not None and value != '']
+            for field, value in values:
+                bitmaps = self.bitmaps[field]
+                bitmaps[value] = self.backend.with_bit(bitmaps.get(value, self.backend.empty()), ordinal)
+            self._values[ordinal] = values
+
+    def _clear(self, ordinal):
+        for field, value in self._values.pop(ordinal, ()):
+            bitmaps = self.bitmaps[field]
+            bitmap = self.backend.without_bit(bitmaps[value], ordinal)
+            if self.backend.count(bitmap):
+                bitmaps[value] = bitmap
+            else:
+                del bitmaps[value]
+
+    def remove(self, recipe_id):
+        with self._lock:
+            ordinal = self._ordinals.pop(recipe_id, None)
+            if ordinal is None:
+                return
+            self._clear(ordinal)
+            self._recipe_ids[ordinal] = None
+            self.all = self.backend.without_bit(self.all, ordinal)
+
+    def _union(self, field, values):
+        bitmaps = self.bitmaps[field]
+        result = self.backend.empty()
+        for value in values:
+            if value in bitmaps:
+                result = result | bitmaps[value]
+        return result
+
+    def _range(self, field, lower=None, upper=None):
+        values = [
+            value for value in self.bitmaps[field]
+            if (lower is None or value >= lower) and (upper is None or value <= upper)
+        ]
+        return self._union(field, values)
+
+    def _ingredients(self, term):
+        # Как в IngredientService: подстрока ищется по словарю ингредиентов
+        key = canonical_name(term)
+        return self._union('ingredient', [name for name in self.bitmaps['ingredient'] if key in name])
+
+    def match(self, recipe_filter):
+        """Битмап рецептов под условия фильтра (AND / ANDNOT по полям)"""
+        with self._lock:
+            result = self.all
+            if recipe_filter.category:
+                result = result & self._union('category', [recipe_filter.category])
+            if recipe_filter.difficulty:
+                result = result & self._union('difficulty', [recipe_filter.difficulty])
+            if recipe_filter.min_cooking_time is not None or recipe_filter.max_cooking_time is not None:
+                result = result & self._range(
+                    'cooking_time', recipe_filter.min_cooking_time, recipe_filter.max_cooking_time
+                )
+            if recipe_filter.min_servings is not None or recipe_filter.max_servings is not None:
+                result = result & self._range(
+                    'servings', recipe_filter.min_servings, recipe_filter.max_servings
+                )
+            if recipe_filter.author_id is not None:
+                result = result & self._union('author_id', [recipe_filter.author_id])
+            for term in recipe_filter.include_ingredients or ():
+                if canonical_name(term):
+                    result = result & self._ingredients(term)
+            for term in recipe_filter.exclude_ingredients or ():
+                if canonical_name(term):
+                    result = self.backend.difference(result, self._ingredients(term))
+            # Без условий результат - сам self.all: вызывающий читает его уже без
+            # блокировки, а запись меняет битмапы roaring на месте
+            return self.backend.copy(result) if result is self.all else result
+
+    def page(self, bitmap, after=None, limit=50):
+        """id рецептов страницы (от новых к старым), начиная после позиции курсора"""
+        with self._lock:
+            if after is not None:
+                bitmap = self.backend.below(bitmap, bisect_left(self._keys, after))
+            recipe_ids = []
+            for ordinal in self.backend.descending(bitmap):
+                recipe_ids.append(self._recipe_ids[ordinal])
+                if len(recipe_ids) >= limit:
+                    break
+            return recipe_ids
+
+    def count(self, bitmap):
+        return self.backend.count(bitmap)
+
+    def facets(self, bitmap):
+        """Счетчики как у FacetService, через popcount пересечений"""
+        with self._lock:
+            total = self.backend.count(bitmap)
+
+            def counts(field):
+                items = []
+                for value, value_bitmap in self.bitmaps[field].items():
+                    count = self.backend.count(bitmap & value_bitmap)
+                    if count:
+                        items.append({'value': value, 'count': count})
+                items.sort(key=lambda item: (-item['count'], item['value']))
+                return items
+
+            return {
+                'total': total,
+                'category': counts('category'),
+                'difficulty': counts('difficulty'),
+                'cooking_time': [
+                    {
+                        'value': label, 'min': lower, 'max': upper,
+                        'count': self.backend.count(bitmap & self._range('cooking_time', lower, upper)),
+                    }
+                    for label, lower, upper in COOKING_TIME_BUCKETS
+                ],
+            }
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': self.backend.name,
+                'recipes': len(self._ordinals),
+                'ordinals': len(self._recipe_ids),
+                'bitmaps': {field: len(bitmaps) for field, bitmaps in self.bitmaps.items()},
+                'ordered': self.ordered,
+            }
+
+
+class RecipeBitmapIndex(RecipeIndex):
+    """Фильтры и счетчики /api/recipes/filter и /facets по битмапам в памяти процесса.
+
+    Отвечает только на то, что выражается битмапами: сортировка по новизне и
+    условия по категории, сложности, времени, порциям, автору и ингредиентам.
+    Для остального (текст, рейтинг, другие сортировки) supports() = False и
+    запрос идет в БД.
+    """
+
+    COLUMNS = ('id', 'created_at', 'category', 'difficulty', 'cooking_time', 'servings',
+               'author_id', 'ingredients')
+
+    def create_index(self):
+        return BitmapIndex(bitmap_backend())
+
+    def document(self, recipe):
+        return {
+            'created_at': recipe.created_at,
+            'category': recipe.category,
+            'difficulty': recipe.difficulty,
+            # 0 и NULL в фильтрах БД различаются, а здесь NULL просто не индексируется
+            'cooking_time': recipe.cooking_time,
+            'servings': recipe.servings,
+            'author_id': recipe.author_id,
+            'ingredients': list(dict.fromkeys(
+                filter(None, (canonical_name(name) for name in ingredient_names(recipe.ingredients)))
+            )),
+        }
+
+    @staticmethod
+    def supports(recipe_filter):
+        """Все условия фильтра выражаются битмапами"""
+        return (
+            not recipe_filter.text
+            and not recipe_filter.author
+            and recipe_filter.min_rating is None
+        )
+
+    def filter(self, recipe_filter, cursor=None, limit=None, fields=None):
+        """(recipes, next_cursor) как у paginate или None, если фильтр не поддерживается"""
+        if recipe_filter.sort != 'newest' or not self.supports(recipe_filter):
+            return None
+        index = self.ensure_built()
+        position = NEWEST.decode_cursor(cursor)
+        if position and not index.ordered:
+            return None
+        limit = parse_limit(limit)
+        recipe_ids = index.page(index.match(recipe_filter), position, limit + 1)
+        recipes = fetch_in_order(recipe_ids[:limit], fields)
+        next_cursor = None
+        if len(recipe_ids) > limit and recipes:
+            next_cursor = NEWEST.encode_cursor(recipes[-1])
+        return recipes, next_cursor
+
+    def facets(self, recipe_filter):
+        """Счетчики для фильтра или None, если фильтр не поддерживается"""
+        if not self.supports(recipe_filter):
+            return None
+        index = self.ensure_built()
+        return index.facets(index.match(recipe_filter))
+
+
+recipe_bitmaps = RecipeBitmapIndex(refresh_interval=Config.RECIPE_SEARCH_INDEX_REFRESH)
@@ -0,0 +1,240 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config import Config
+
+
+class LRUCache:
+    """Кэш в памяти процесса: LRU-вытеснение по числу записей + TTL"""
+
+    def __init__(self, max_entries=1000, ttl=15):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCacheTier:
+    """Общий L2 на Redis-совместимом сервере (нужен пакет redis)"""
+
+    name = 'redis'
+
+    def __init__(self, url, ttl):
+        import redis  # необязательная зависимость
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5)
+        self.ttl = ttl
+
+    def get(self, key):
+        value = self.client.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value):
+        self.client.set(key, json.dumps(value, ensure_ascii=False), ex=self.ttl)
+
+    def delete(self, key):
+        self.client.delete(key)
+
+
+class DiskCacheTier:
+    """Общий L2 в локальном SQLite-файле: его видят все воркеры gunicorn на хосте"""
+
+    name = 'disk'
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS cache '
+            '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+        )
+
+    def _connection(self):
+        # sqlite3-соединение нельзя делить между потоками - держим свое на поток
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value, expires_at FROM cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        self._connection().execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, json.dumps(value, ensure_ascii=False), time.time() + self.ttl)
+        )
+
+    def delete(self, key):
+        self._connection().execute('DELETE FROM cache WHERE key = ?', (key,))
+
+
+class RecipeCache:
+    """Двухуровневый кэш сериализованных рецептов.
+
+    L1 - LRU в процессе с коротким TTL, L2 (необязательный) - общий для всех
+    воркеров. Инвалидация сквозная: сервисы вызывают invalidate_recipe() в точках
+    изменения, запись удаляется из своего L1 и из L2; L1 других воркеров
+    сходится не дольше чем за RECIPE_CACHE_LOCAL_TTL.
+    """
+
+    def __init__(self, local, shared=None, enabled=True):
+        self.local = local
+        self.shared = shared
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {
+            'local_hits': 0,
+            'shared_hits': 0,
+            'misses': 0,
+            'sets': 0,
+            'invalidations': 0,
+            'shared_errors': 0,
+        }
+
+    @classmethod
+    def from_config(cls, config=Config):
+        shared = None
+        try:
+            if config.RECIPE_CACHE_BACKEND == 'redis':
+                shared = RedisCacheTier(config.RECIPE_CACHE_REDIS_URL, config.RECIPE_CACHE_SHARED_TTL)
+            elif config.RECIPE_CACHE_BACKEND == 'disk':
+                shared = DiskCacheTier(config.RECIPE_CACHE_DISK_PATH, config.RECIPE_CACHE_SHARED_TTL)
+        except Exception as e:
+            print(f"WARNING: Shared recipe cache '{config.RECIPE_CACHE_BACKEND}' disabled: {e}")
+            shared = None
+        local = LRUCache(config.RECIPE_CACHE_MAX_ENTRIES, config.RECIPE_CACHE_LOCAL_TTL)
+        return cls(local, shared, enabled=config.RECIPE_CACHE_ENABLED)
+
+    # Счетчики фильтров без условий (/api/recipes/facets, get_categories)
+    FACETS_KEY = 'facets:all'
+
+    @staticmethod
+    def recipe_key(recipe_id):
+        return f'recipe:{recipe_id}'
+
+    def _count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        value = self.local.get(key)
+        if value is not None:
+            self._count('local_hits')
+            return value
+        if self.shared:
+            try:
+                value = self.shared.get(key)
+            except Exception as e:
+                self._count('shared_errors')
+                print(f"WARNING: Shared recipe cache get failed: {e}")
+                value = None
+            if value is not None:
+                self._count('shared_hits')
+                self.local.set(key, value)
+                return value
+        self._count('misses')
+        return None
+
+    def set(self, key, value):
+        if not self.enabled:
+            return
+        self._count('sets')
+        self.local.set(key, value)
+        if self.shared:
+            try:
+                self.shared.set(key, value)
+            except Exception as e:
+                self._count('shared_errors')
+                print(f"WARNING: Shared recipe cache set failed: {e}")
+
+    def delete(self, key):
+        self.local.delete(key)
+        if self.shared:
+            try:
+                self.shared.delete(key)
+            except Exception as e:
+                self._count('shared_errors')
+                print(f"WARNING: Shared recipe cache delete failed: {e}")
+
+    def invalidate_recipe(self, recipe_id):
+        """Сбросить кэш рецепта после любого изменения его данных или счетчиков"""
+        self._count('invalidations')
+        self.delete(self.recipe_key(recipe_id))
+
+    def invalidate_facets(self):
+        """Сбросить общие счетчики фильтров после создания, изменения или удаления рецепта"""
+        self._count('invalidations')
+        self.delete(self.FACETS_KEY)
+
+    def clear(self):
+        self.local.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['local_hits'] + stats['shared_hits'] + stats['misses']
+        stats.update({
+            'enabled': self.enabled,
+            'shared_backend': self.shared.name if self.shared else None,
+            'local_size': len(self.local),
+            'local_max_entries': self.local.max_entries,
+            'local_evictions': self.local.evictions,
+            'local_expirations': self.local.expirations,
+            'hit_ratio': round((stats['local_hits'] + stats['shared_hits']) / lookups, 3) if lookups else 0.0,
+        })
+        return stats
+
+
+# Один кэш на процесс - общий для всех сервисов (как session_store в auth_service)
+recipe_cache = RecipeCache.from_config()
@@ -1,6 +1,7 @@
 from models.db import db
 from datetime import datetime
-from models.recipe import Recipe
+from services.cache_service import recipe_cache
+from services.counter_service import counter_service
 
 class CommentService:
     def __init__(self):
@@ -17,18 +18,27 @@ class CommentService:
             )
             db.session.add(comment)
             
-            # Обновляем счетчик комментариев в рецепте
-            recipe = db.session.get(Recipe, recipe_id)
-            if recipe:
-                recipe.comments_count += 1
+            # Счетчик комментариев - атомарно, в той же транзакции
+            counter_service.increment(recipe_id, 'comments_count')
             
             db.session.commit()
+            recipe_cache.invalidate_recipe(recipe_id)
             return comment
         except Exception as e:
             db.session.rollback()
             print(f"Error adding comment: {e}")
             return None
     
+    def counts(self, recipe_ids):
+        """{recipe_id: число комментариев} одним GROUP BY; у рецептов без комментариев - 0"""
+        from models.recipe import Comment
+        counts = dict(
+            db.session.query(Comment.recipe_id, db.func.count(Comment.id))
+            .filter(Comment.recipe_id.in_(recipe_ids))
+            .group_by(Comment.recipe_id)
+        )
+        return {recipe_id: counts.get(recipe_id, 0) for recipe_id in recipe_ids}
+    
     def get_comments_for_recipe(self, recipe_id):
         from models.recipe import Comment
         return Comment.query.filter_by(recipe_id=recipe_id).order_by(Comment.created_at.desc()).all()
@@ -38,13 +48,12 @@ class CommentService:
             from models.recipe import Comment
             comment = Comment.query.get(comment_id)
             if comment and comment.user_id == user_id:
-                # Обновляем счетчик комментариев в рецепте
-                recipe = db.session.get(Recipe, comment.recipe_id)
-                if recipe and recipe.comments_count > 0:
-                    recipe.comments_count -= 1
+                counter_service.decrement(comment.recipe_id, 'comments_count')
                 
+                recipe_id = comment.recipe_id
                 db.session.delete(comment)
                 db.session.commit()
+                recipe_cache.invalidate_recipe(recipe_id)
                 return True
             return False
         except Exception as e:
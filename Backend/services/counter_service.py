@@ -0,0 +1,59 @@
+from sqlalchemy import bindparam, case
+from models.db import db
+from models.recipe import Recipe
+
+
+class CounterService:
+    """Атомарные счетчики рецептов: одно UPDATE ... SET col = col + :delta RETURNING col.
+
+    Значение не читается в Python и не пишется обратно, поэтому параллельные
+    запросы не теряют приращения, а строка заблокирована только на время
+    самого UPDATE. Изменения идут в текущей транзакции db.session - commit
+    делает вызывающий сервис вместе с остальными изменениями.
+    """
+
+    COLUMNS = ('views', 'likes', 'comments_count', 'favorites_count')
+
+    def _column(self, column):
+        if column not in self.COLUMNS:
+            raise ValueError(f'Unknown counter: {column}')
+        return Recipe.__table__.c[column]
+
+    def _values(self, column, delta, touch):
+        counter = self._column(column)
+        value = db.func.coalesce(counter, 0) + delta
+        # Счетчик не уходит в минус, даже если уменьшения пришли раньше увеличений
+        values = {column: case((value < 0, 0), else_=value)}
+        if not touch:
+            # Без onupdate: updated_at (а с ним Last-Modified/ETag) не сдвигается
+            values['updated_at'] = Recipe.__table__.c.updated_at
+        return values
+
+    def increment(self, recipe_id, column, delta=1, touch=True):
+        """Новое значение счетчика или None, если рецепта нет"""
+        table = Recipe.__table__
+        statement = table.update().where(table.c.id == recipe_id).values(
+            **self._values(column, delta, touch)
+        ).returning(self._column(column))
+        return db.session.execute(statement).scalar()
+
+    def decrement(self, recipe_id, column, delta=1, touch=True):
+        return self.increment(recipe_id, column, -delta, touch)
+
+    def increment_many(self, column, deltas, connection=None, touch=False):
+        """Пачка приращений {recipe_id: delta} одним executemany.
+
+        connection - отдельное соединение (фоновый сброс просмотров), иначе db.session.
+        """
+        if not deltas:
+            return
+        table = Recipe.__table__
+        statement = table.update().where(table.c.id == bindparam('recipe_id')).values(
+            **self._values(column, bindparam('delta'), touch)
+        )
+        # Один порядок блокировок строк во всех воркерах
+        rows = [{'recipe_id': recipe_id, 'delta': delta} for recipe_id, delta in sorted(deltas.items())]
+        (connection or db.session).execute(statement, rows)
+
+
+counter_service = CounterService()
@@ -0,0 +1,92 @@
+from sqlalchemy import select, literal, union_all, case, tuple_, text
+from models.db import db
+from models.recipe import Recipe
+
+# Интервалы времени приготовления (минуты, включительно); последний - без верхней границы
+COOKING_TIME_BUCKETS = (
+    ('0-15', 0, 15),
+    ('16-30', 16, 30),
+    ('31-60', 31, 60),
+    ('60+', 61, None),
+)
+
+FACETS = ('category', 'difficulty', 'cooking_time')
+
+
+def cooking_time_bucket():
+    """CASE-выражение: метка интервала из COOKING_TIME_BUCKETS для recipes.cooking_time"""
+    minutes = db.func.coalesce(Recipe.cooking_time, 0)
+    bounded = [(minutes <= upper, label) for label, _, upper in COOKING_TIME_BUCKETS if upper is not None]
+    return case(*bounded, else_=COOKING_TIME_BUCKETS[-1][0])
+
+
+class FacetService:
+    """Счетчики для панели фильтров: категории, сложность, интервалы времени.
+
+    Все три разреза и общее число считаются одним запросом по отфильтрованной
+    выборке: GROUPING SETS на PostgreSQL, UNION ALL группировок на SQLite.
+    """
+
+    def _filtered(self, recipe_filter, ingredients, search):
+        query = db.session.query(
+            Recipe.category.label('category'),
+            Recipe.difficulty.label('difficulty'),
+            cooking_time_bucket().label('cooking_time')
+        )
+        if recipe_filter is not None:
+            query = recipe_filter.apply(query, ingredients, search)
+        return query.subquery('filtered')
+
+    def _rows_grouping_sets(self, filtered):
+        # grouping() = 1 у колонки, по которой в этом наборе не группировали
+        columns = [filtered.c[facet] for facet in FACETS]
+        statement = select(
+            *columns,
+            *(db.func.grouping(column).label(f'grouping_{column.name}') for column in columns),
+            db.func.count().label('count')
+        ).group_by(db.func.grouping_sets(*(tuple_(column) for column in columns), text('()')))
+
+        rows = []
+        for row in db.session.execute(statement):
+            grouped = [facet for facet in FACETS if not getattr(row, f'grouping_{facet}')]
+            facet = grouped[0] if grouped else None
+            rows.append((facet, getattr(row, facet) if facet else None, row.count))
+        return rows
+
+    def _rows_union(self, filtered):
+        parts = [
+            select(literal(facet).label('facet'), filtered.c[facet].label('value'), db.func.count())
+            .group_by(filtered.c[facet])
+            for facet in FACETS
+        ]
+        parts.append(
+            select(literal(None).label('facet'), literal(None).label('value'), db.func.count())
+            .select_from(filtered)
+        )
+        return [tuple(row) for row in db.session.execute(union_all(*parts))]
+
+    def facets(self, recipe_filter=None, ingredients=None, search=None):
+        """{'total': n, 'category': [{'value', 'count'}], 'difficulty': [...], 'cooking_time': [...]}"""
+        filtered = self._filtered(recipe_filter, ingredients, search)
+        if db.engine.dialect.name == 'postgresql':
+            rows = self._rows_grouping_sets(filtered)
+        else:
+            rows = self._rows_union(filtered)
+
+        result = {'total': 0}
+        result.update({facet: [] for facet in FACETS})
+        for facet, value, count in rows:
+            if facet is None:
+                result['total'] = count
+            elif value is not None and value != '':
+                result[facet].append({'value': value, 'count': count})
+
+        for facet in ('category', 'difficulty'):
+            result[facet].sort(key=lambda item: (-item['count'], item['value']))
+        # Интервалы времени - в порядке возрастания, включая пустые
+        counts = {item['value']: item['count'] for item in result['cooking_time']}
+        result['cooking_time'] = [
+            {'value': label, 'min': lower, 'max': upper, 'count': counts.get(label, 0)}
+            for label, lower, upper in COOKING_TIME_BUCKETS
+        ]
+        return result
@@ -1,11 +1,31 @@
+from sqlalchemy import bindparam
+from sqlalchemy.exc import IntegrityError
 from models.db import db
 from models.user import Favorite
 from models.recipe import Recipe
+from services.cache_service import recipe_cache
+from services.counter_service import counter_service
 
 class FavoriteService:
     def __init__(self):
         pass
     
+    def _insert(self, user_id, recipe_id):
+        """Строка favorites и +1 к recipes.favorites_count в текущей транзакции"""
+        db.session.add(Favorite(user_id=user_id, recipe_id=recipe_id))
+        db.session.flush()
+        # updated_at сдвигается: favorites_count есть в списках, их ETag должен смениться
+        counter_service.increment(recipe_id, 'favorites_count')
+    
+    def _delete(self, user_id, recipe_id):
+        """Удалить строку favorites; счетчик уменьшается, только если строка была"""
+        deleted = Favorite.query.filter_by(user_id=user_id, recipe_id=recipe_id).delete(
+            synchronize_session=False
+        )
+        if deleted:
+            counter_service.decrement(recipe_id, 'favorites_count', deleted)
+        return deleted
+    
     def add_to_favorites(self, user_id, recipe_id):
         try:
             # Проверяем, нет ли уже в избранном
@@ -17,9 +37,13 @@ class FavoriteService:
             if existing_favorite:
                 return True  # Уже в избранном
                 
-            favorite = Favorite(user_id=user_id, recipe_id=recipe_id)
-            db.session.add(favorite)
+            self._insert(user_id, recipe_id)
             db.session.commit()
+            recipe_cache.invalidate_recipe(recipe_id)
+            return True
+        except IntegrityError:
+            # Параллельный запрос того же пользователя успел добавить первым
+            db.session.rollback()
             return True
         except Exception as e:
             db.session.rollback()
@@ -28,30 +52,83 @@ class FavoriteService:
     
     def remove_from_favorites(self, user_id, recipe_id):
         try:
-            favorite = Favorite.query.filter_by(
-                user_id=user_id, 
-                recipe_id=recipe_id
-            ).first()
-            
-            if favorite:
-                db.session.delete(favorite)
+            if self._delete(user_id, recipe_id):
                 db.session.commit()
+                recipe_cache.invalidate_recipe(recipe_id)
                 return True
+            db.session.rollback()
             return False
         except Exception as e:
             db.session.rollback()
             print(f"Error removing from favorites: {e}")
             return False
     
+    def toggle_favorite(self, user_id, recipe_id):
+        """Убрать из избранного, если рецепт там есть, иначе добавить.
+        
+        Одна транзакция; возвращает новое состояние (True - в избранном) или None при ошибке.
+        """
+        try:
+            if self._delete(user_id, recipe_id):
+                is_favorite = False
+            else:
+                self._insert(user_id, recipe_id)
+                is_favorite = True
+            db.session.commit()
+            recipe_cache.invalidate_recipe(recipe_id)
+            return is_favorite
+        except IntegrityError:
+            # Параллельный toggle того же пользователя тоже не нашел строку и вставил
+            # ее первым (unique constraint): рецепт в избранном, счетчик увеличил он
+            db.session.rollback()
+            return True
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error toggling favorite: {e}")
+            return None
+    
+    def counts(self, recipe_ids):
+        """{recipe_id: число строк favorites} одним GROUP BY; у рецептов без избранного - 0"""
+        counts = dict(
+            db.session.query(Favorite.recipe_id, db.func.count(Favorite.id))
+            .filter(Favorite.recipe_id.in_(recipe_ids))
+            .group_by(Favorite.recipe_id)
+        )
+        return {recipe_id: counts.get(recipe_id, 0) for recipe_id in recipe_ids}
+    
+    def backfill(self, batch_size=500):
+        """Пересчитать recipes.favorites_count из favorites (идемпотентно), пачками по id"""
+        table = Recipe.__table__
+        statement = table.update().where(table.c.id == bindparam('recipe_id')).values(
+            favorites_count=bindparam('count'),
+            updated_at=table.c.updated_at
+        )
+        last_id = 0
+        updated = 0
+        while True:
+            recipe_ids = [row.id for row in db.session.query(Recipe.id).filter(
+                Recipe.id > last_id
+            ).order_by(Recipe.id).limit(batch_size)]
+            if not recipe_ids:
+                break
+            db.session.execute(statement, [
+                {'recipe_id': recipe_id, 'count': count} for recipe_id, count in self.counts(recipe_ids).items()
+            ])
+            db.session.commit()
+            last_id = recipe_ids[-1]
+            updated += len(recipe_ids)
+            print(f"  избранное пересчитано у {updated} рецептов...")
+        return updated
+    
     def get_favorites(self, user_id):
         favorites = Favorite.query.filter_by(user_id=user_id).all()
         return [fav.recipe_id for fav in favorites]
     
     def get_favorite_recipes(self, user_id):
-        favorites = Favorite.query.filter_by(user_id=user_id).join(
-            Recipe, Favorite.recipe_id == Recipe.id
-        ).all()
-        return [fav.recipe.to_dict() for fav in favorites]
+        recipes = Recipe.query.join(
+            Favorite, Favorite.recipe_id == Recipe.id
+        ).filter(Favorite.user_id == user_id).all()
+        return Recipe.to_dict_list(recipes)
     
     def is_favorite(self, user_id, recipe_id):
         favorite = Favorite.query.filter_by(
@@ -0,0 +1,64 @@
+import hashlib
+import math
+import zlib
+
+# 2^-r для всех возможных значений регистра - оценка без pow в цикле
+_INVERSE_POWERS = tuple(2.0 ** -rank for rank in range(65))
+
+
+class HyperLogLog:
+    """Оценка числа уникальных значений в 2^precision байтах.
+
+    Значение хэшируется в 64 бита: старшие precision бит выбирают регистр,
+    в регистре хранится максимальная позиция первой единицы в остальных.
+    Относительная ошибка ~1.04 / sqrt(2^precision): при precision=12
+    (4 КБ) - около 1.6%. Слияние двух скетчей - поэлементный максимум,
+    поэтому частичные скетчи воркеров можно объединять в любом порядке.
+    """
+
+    def __init__(self, precision=12, registers=None):
+        if not 4 <= precision <= 16:
+            raise ValueError('Invalid precision')
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.size)
+
+    def add(self, value):
+        digest = hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest()
+        hashed = int.from_bytes(digest, 'big')
+        bits = 64 - self.precision
+        index = hashed >> bits
+        rank = bits - (hashed & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError('Cannot merge sketches with different precision')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        size = self.size
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(_INVERSE_POWERS[rank] for rank in self.registers)
+        if estimate <= 2.5 * size:
+            # На малых числах точнее линейный подсчет по пустым регистрам
+            zeros = self.registers.count(0)
+            if zeros:
+                estimate = size * math.log(size / zeros)
+        return int(round(estimate))
+
+    def is_empty(self):
+        return not any(self.registers)
+
+    def to_bytes(self):
+        """Байт точности + сжатые регистры: у редко просматриваемых рецептов почти одни нули"""
+        return zlib.compress(bytes([self.precision]) + bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data):
+        raw = zlib.decompress(data)
+        return cls(raw[0], raw[1:])
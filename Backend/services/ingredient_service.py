@@ -0,0 +1,117 @@
+import re
+from sqlalchemy import select, exists, delete, insert, or_
+from sqlalchemy.dialects.postgresql import insert as postgres_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models.db import db
+from models.recipe import Recipe, Ingredient, RecipeIngredient
+from services.text_index import normalize, parse_ingredients
+
+
+def canonical_name(name):
+    """'  Яйца  куриные. ' -> 'яйца куриные' - ключ словаря ингредиентов"""
+    return re.sub(r'\s+', ' ', normalize(name)).strip(' .,;:-')[:200]
+
+
+def _short(value, length=50):
+    if value is None or value == '':
+        return None
+    return str(value).strip()[:length] or None
+
+
+class IngredientService:
+    """Нормализованные ингредиенты: словарь ingredients и связи recipe_ingredients.
+
+    JSON-колонка recipes.ingredients остается источником для отображения,
+    таблицы поддерживаются при записи рецепта и нужны для фильтров по
+    ингредиентам через индексы вместо ILIKE по всему JSON.
+    """
+
+    def _insert_ignore(self, table):
+        """INSERT ... ON CONFLICT DO NOTHING для PostgreSQL и SQLite"""
+        if db.engine.dialect.name == 'postgresql':
+            return postgres_insert(table).on_conflict_do_nothing()
+        return sqlite_insert(table).on_conflict_do_nothing()
+
+    def ingredient_ids(self, names):
+        """{каноническое название: id}; недостающие добавляются в словарь"""
+        names = set(names)
+        if not names:
+            return {}
+        ids = dict(db.session.query(Ingredient.name, Ingredient.id).filter(Ingredient.name.in_(names)))
+        missing = names - ids.keys()
+        if missing:
+            # Параллельная запись могла добавить то же название - конфликт не ошибка
+            db.session.execute(self._insert_ignore(Ingredient), [{'name': name} for name in missing])
+            ids.update(db.session.query(Ingredient.name, Ingredient.id).filter(Ingredient.name.in_(missing)))
+        return ids
+
+    def sync_recipe(self, recipe):
+        """Переписать recipe_ingredients рецепта по его JSON (в текущей транзакции, без commit)"""
+        items = {}
+        for position, (name, amount, unit) in enumerate(parse_ingredients(recipe.ingredients)):
+            key = canonical_name(name)
+            if key and key not in items:
+                items[key] = (position, amount, unit)
+
+        db.session.execute(delete(RecipeIngredient).where(RecipeIngredient.recipe_id == recipe.id))
+        if not items:
+            return
+        ids = self.ingredient_ids(items)
+        db.session.execute(insert(RecipeIngredient), [
+            {
+                'recipe_id': recipe.id,
+                'ingredient_id': ids[key],
+                'qty': _short(amount),
+                'unit': _short(unit),
+                'position': position,
+            }
+            for key, (position, amount, unit) in items.items()
+        ])
+
+    def _matching_ids(self, terms):
+        # Подстрока ищется по словарю (он на порядки меньше рецептов),
+        # дальше рецепты находятся по индексу recipe_ingredients
+        conditions = [Ingredient.name.contains(canonical_name(term), autoescape=True) for term in terms]
+        return select(Ingredient.id).where(or_(*conditions))
+
+    @staticmethod
+    def _terms(terms):
+        return [term for term in (terms or []) if canonical_name(term)]
+
+    def include_filters(self, terms):
+        """По полусоединению на каждый термин: рецепт содержит их все"""
+        return [
+            exists().where(
+                RecipeIngredient.recipe_id == Recipe.id,
+                RecipeIngredient.ingredient_id.in_(self._matching_ids([term]))
+            )
+            for term in self._terms(terms)
+        ]
+
+    def exclude_filter(self, terms):
+        """Антисоединение: ни одного из терминов; None если исключать нечего"""
+        terms = self._terms(terms)
+        if not terms:
+            return None
+        return ~exists().where(
+            RecipeIngredient.recipe_id == Recipe.id,
+            RecipeIngredient.ingredient_id.in_(self._matching_ids(terms))
+        )
+
+    def backfill(self, batch_size=500):
+        """Заполнить recipe_ingredients для всех рецептов (идемпотентно), пачками по id"""
+        last_id = 0
+        synced = 0
+        while True:
+            recipes = db.session.query(Recipe.id, Recipe.ingredients).filter(
+                Recipe.id > last_id
+            ).order_by(Recipe.id).limit(batch_size).all()
+            if not recipes:
+                break
+            for recipe in recipes:
+                self.sync_recipe(recipe)
+            db.session.commit()
+            last_id = recipes[-1].id
+            synced += len(recipes)
+            print(f"  ингредиенты разобраны у {synced} рецептов...")
+        return synced
@@ -0,0 +1,209 @@
+import base64
+import json
+from datetime import datetime
+from itertools import islice
+from sqlalchemy import or_, and_
+from config import Config
+from models.recipe import Recipe
+
+
+class SortOrder:
+    """Порядок выдачи для keyset-пагинации: выражение сортировки + id для равных значений.
+
+    Курсор хранит (значение, id) последней строки страницы; parse восстанавливает
+    значение из JSON (например datetime из ISO-строки).
+    """
+
+    def __init__(self, name, expression, descending=True, parse=None, default=None):
+        self.name = name
+        self.expression = expression
+        self.descending = descending
+        self.parse = parse or (lambda value: value)
+        self.default = default  # чем заменяется NULL (в выражении - тоже coalesce)
+
+    def order_by(self):
+        if self.descending:
+            return self.expression.desc(), Recipe.id.desc()
+        return self.expression.asc(), Recipe.id.asc()
+
+    def after(self, value, recipe_id):
+        """Условие "строка идет после (value, recipe_id)" в этом порядке"""
+        if self.descending:
+            return or_(
+                self.expression < value,
+                and_(self.expression == value, Recipe.id < recipe_id)
+            )
+        return or_(
+            self.expression > value,
+            and_(self.expression == value, Recipe.id > recipe_id)
+        )
+
+    def value_of(self, row):
+        value = getattr(row, self.name)
+        return self.default if value is None else value
+
+    def encode_cursor(self, row):
+        return encode_cursor(self.value_of(row), row.id)
+
+    def decode_cursor(self, cursor):
+        position = decode_cursor(cursor)
+        if not position:
+            return None
+        value, recipe_id = position
+        try:
+            return self.parse(value), recipe_id
+        except (TypeError, ValueError):
+            raise ValueError('Invalid cursor')
+
+
+def encode_cursor(value, recipe_id):
+    """Упаковать позицию (значение сортировки, id) в непрозрачную строку курсора"""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps([value, recipe_id], ensure_ascii=False)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Распаковать курсор в (значение, id); ValueError если он поврежден"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, recipe_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return value, int(recipe_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+# Порядок по умолчанию: от новых к старым (индекс ix_recipes_created_at_id)
+NEWEST = SortOrder('created_at', Recipe.created_at, descending=True, parse=datetime.fromisoformat)
+
+
+def encode_offset_cursor(offset, mode=None):
+    """Курсор для ранжированных выдач (поиск), где порядок не по (created_at, id).
+
+    mode запоминает, какой выдачей начали листать (например 'fuzzy'),
+    чтобы следующие страницы брались из нее же.
+    """
+    payload = {'offset': offset}
+    if mode:
+        payload['mode'] = mode
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+def _offset_cursor_payload(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    if not isinstance(payload, dict):
+        raise ValueError('Invalid cursor')
+    return payload
+
+
+def decode_offset_cursor(cursor):
+    """Смещение из курсора ранжированной выдачи; ValueError если он поврежден"""
+    if not cursor:
+        return 0
+    try:
+        offset = int(_offset_cursor_payload(cursor)['offset'])
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if offset < 0:
+        raise ValueError('Invalid cursor')
+    return offset
+
+
+def offset_cursor_mode(cursor):
+    """mode из курсора ранжированной выдачи или None (в т.ч. для keyset-курсора)"""
+    if not cursor:
+        return None
+    try:
+        return _offset_cursor_payload(cursor).get('mode')
+    except Exception:
+        return None
+
+
+def parse_limit(limit):
+    """Размер страницы из запроса, ограниченный RECIPES_MAX_PAGE_SIZE"""
+    if limit is None or limit == '':
+        return Config.RECIPES_PAGE_SIZE
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid limit')
+    if limit < 1:
+        raise ValueError('Invalid limit')
+    return min(limit, Config.RECIPES_MAX_PAGE_SIZE)
+
+
+def paginate(query, cursor=None, limit=None, fields=None, order=NEWEST):
+    """Keyset-пагинация в порядке order (по умолчанию от новых к старым).
+
+    Возвращает (recipes, next_cursor); next_cursor = None на последней странице.
+    Берем limit + 1 строк, чтобы узнать, есть ли следующая страница, без COUNT(*).
+    С fields выбираются только нужные колонки, и вместо объектов Recipe
+    возвращаются строки для Recipe.rows_to_dicts().
+    """
+    limit = parse_limit(limit)
+    if fields:
+        # Колонка сортировки нужна для курсора, даже если ее не просили
+        query = query.with_entities(*Recipe.columns_for(fields, extra=(order.name,)))
+    position = order.decode_cursor(cursor)
+    if position:
+        query = query.filter(order.after(*position))
+
+    recipes = query.order_by(*order.order_by()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(recipes) > limit:
+        recipes = recipes[:limit]
+        next_cursor = order.encode_cursor(recipes[-1])
+    return recipes, next_cursor
+
+
+def iterate_chunks(query, fields=None, chunk_size=None, order=NEWEST):
+    """Весь результат запроса пачками (списками) в порядке order.
+
+    Строки тянутся через yield_per, так что в памяти одновременно только одна
+    пачка - для потоковых ответов, где страница не ограничена limit.
+    """
+    chunk_size = chunk_size or Config.RECIPES_STREAM_CHUNK_SIZE
+    if fields:
+        query = query.with_entities(*Recipe.columns_for(fields))
+    rows = iter(query.order_by(*order.order_by()).yield_per(chunk_size))
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def fetch_in_order(recipe_ids, fields=None):
+    """Рецепты (или строки проекции под fields) по списку id в том же порядке"""
+    if not recipe_ids:
+        return []
+    query = Recipe.query.filter(Recipe.id.in_(recipe_ids))
+    if fields:
+        query = query.with_entities(*Recipe.columns_for(fields))
+    by_id = {row.id: row for row in query.all()}
+    return [by_id[recipe_id] for recipe_id in recipe_ids if recipe_id in by_id]
+
+
+def paginate_ranked(ranked_ids, cursor=None, limit=None, fields=None, mode=None):
+    """Страница ранжированной выдачи: (recipes, next_cursor).
+
+    ranked_ids(offset, limit) -> [(recipe_id, score)] по убыванию релевантности.
+    """
+    limit = parse_limit(limit)
+    offset = decode_offset_cursor(cursor)
+    ranked = ranked_ids(offset, limit + 1)
+    next_cursor = encode_offset_cursor(offset + limit, mode) if len(ranked) > limit else None
+    recipe_ids = [recipe_id for recipe_id, _ in ranked[:limit]]
+    return fetch_in_order(recipe_ids, fields), next_cursor
+
+
+def iterate_ranked_chunks(recipe_ids, fields=None, chunk_size=None):
+    """Рецепты по готовому списку id пачками - для потоковой ранжированной выдачи"""
+    chunk_size = chunk_size or Config.RECIPES_STREAM_CHUNK_SIZE
+    for start in range(0, len(recipe_ids), chunk_size):
+        yield fetch_in_order(recipe_ids[start:start + chunk_size], fields)
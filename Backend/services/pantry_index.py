@@ -0,0 +1,143 @@
+import heapq
+import threading
+from collections import Counter
+from config import Config
+from services.ingredient_service import canonical_name
+from services.pagination import parse_limit, fetch_in_order, decode_offset_cursor, encode_offset_cursor
+from services.text_index import RecipeIndex, ingredient_names, tokenize
+
+
+class PantryIndex:
+    """Обратный индекс ингредиентов: название -> рецепты, в которых оно есть.
+
+    Подбор по продуктам проходит только по спискам рецептов совпавших
+    ингредиентов, остальной каталог не просматривается.
+    """
+
+    def __init__(self):
+        self.postings = {}      # каноническое название -> {recipe_id}
+        self._by_word = {}      # слово -> {каноническое название}
+        self._ingredients = {}  # recipe_id -> [(каноническое название, как показывать)]
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._ingredients)
+
+    def add(self, recipe_id, document):
+        with self._lock:
+            self.remove(recipe_id)
+            if not document['ingredients']:
+                return
+            self._ingredients[recipe_id] = document['ingredients']
+            for name, _ in document['ingredients']:
+                recipes = self.postings.get(name)
+                if recipes is None:
+                    recipes = self.postings[name] = set()
+                    for word in tokenize(name):
+                        self._by_word.setdefault(word, set()).add(name)
+                recipes.add(recipe_id)
+
+    def remove(self, recipe_id):
+        with self._lock:
+            for name, _ in self._ingredients.pop(recipe_id, ()):
+                recipes = self.postings[name]
+                recipes.discard(recipe_id)
+                if recipes:
+                    continue
+                del self.postings[name]
+                for word in tokenize(name):
+                    names = self._by_word[word]
+                    names.discard(name)
+                    if not names:
+                        del self._by_word[word]
+
+    def _names(self, item):
+        # 'яйца' покрывает 'яйца куриные': все слова продукта есть в названии ингредиента.
+        # Сравнение по словам, а не по подстроке - иначе 'соль' покрыла бы 'фасоль'
+        words = tokenize(item)
+        if not words:
+            return set()
+        names = set(self._by_word.get(words[0], ()))
+        for word in words[1:]:
+            names &= self._by_word.get(word, set())
+        return names
+
+    def match(self, pantry, min_coverage=0.0):
+        """[(recipe_id, совпало, всего)] рецептов, где есть хотя бы один продукт из pantry"""
+        with self._lock:
+            covered = set()
+            for item in pantry:
+                covered |= self._names(item)
+            counts = Counter()
+            for name in covered:
+                counts.update(self.postings[name])
+            matches = []
+            for recipe_id, matched in counts.items():
+                total = len(self._ingredients[recipe_id])
+                if matched / total >= min_coverage:
+                    matches.append((recipe_id, matched, total))
+            return covered, matches
+
+    def missing(self, recipe_id, covered):
+        """Ингредиенты рецепта, которых нет среди покрытых, в порядке рецепта"""
+        with self._lock:
+            return [display for name, display in self._ingredients.get(recipe_id, ()) if name not in covered]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'recipes': len(self._ingredients),
+                'ingredients': len(self.postings),
+                'postings': sum(len(recipes) for recipes in self.postings.values()),
+            }
+
+
+class RecipePantryIndex(RecipeIndex):
+    """Подбор "что приготовить": рецепты по доле ингредиентов, которые уже есть.
+
+    Ранжирование - по доле покрытых ингредиентов, затем по числу недостающих
+    (при равной доле короткий список покупок лучше) и новизне.
+    """
+
+    COLUMNS = ('id', 'ingredients')
+
+    def create_index(self):
+        return PantryIndex()
+
+    def document(self, recipe):
+        ingredients = {}
+        for name in ingredient_names(recipe.ingredients):
+            key = canonical_name(name)
+            if key and key not in ingredients:
+                ingredients[key] = name.strip()
+        return {'ingredients': list(ingredients.items())}
+
+    def match(self, pantry, cursor=None, limit=None, fields=None, min_coverage=0.0):
+        """(recipes, matches, next_cursor); matches - {recipe_id: {'coverage', 'matched', 'total', 'missing'}}"""
+        limit = parse_limit(limit)
+        offset = decode_offset_cursor(cursor)
+        index = self.ensure_built()
+        covered, matches = index.match(pantry, min_coverage)
+
+        # Нужна только текущая страница - частичная сортировка вместо полной
+        ranked = heapq.nlargest(
+            offset + limit + 1, matches,
+            key=lambda match: (match[1] / match[2], match[1] - match[2], match[0])
+        )[offset:]
+        next_cursor = encode_offset_cursor(offset + limit, 'match') if len(ranked) > limit else None
+        ranked = ranked[:limit]
+
+        details = {
+            recipe_id: {
+                'coverage': round(matched / total, 4),
+                'matched': matched,
+                'total': total,
+                'missing': index.missing(recipe_id, covered),
+            }
+            for recipe_id, matched, total in ranked
+        }
+        recipes = fetch_in_order([recipe_id for recipe_id, _, _ in ranked], fields)
+        return recipes, details, next_cursor
+
+
+recipe_pantry = RecipePantryIndex(refresh_interval=Config.RECIPE_SEARCH_INDEX_REFRESH)
@@ -1,50 +1,153 @@
+from sqlalchemy import bindparam, case
+from sqlalchemy.exc import IntegrityError
 from models.db import db
 from models.recipe import Rating, Recipe
+from services.cache_service import recipe_cache
 
 class RatingService:
     def __init__(self):
         pass
     
+    # Попыток записать оценку, если ее параллельно меняет тот же пользователь
+    MAX_ATTEMPTS = 5
+
     def add_rating(self, recipe_id, user_id, rating_value):
         try:
-            # Проверяем существующий рейтинг
-            existing_rating = Rating.query.filter_by(
-                user_id=user_id, 
-                recipe_id=recipe_id
-            ).first()
-            
-            if existing_rating:
-                # Обновляем существующий рейтинг
-                old_rating = existing_rating.rating
-                existing_rating.rating = rating_value
-            else:
-                # Добавляем новый рейтинг
-                rating = Rating(
-                    user_id=user_id,
-                    recipe_id=recipe_id,
-                    rating=rating_value
-                )
-                db.session.add(rating)
-            
-            # Пересчитываем средний рейтинг
-            self._update_recipe_rating(recipe_id)
-            db.session.commit()
-            return True
+            for _ in range(self.MAX_ATTEMPTS):
+                if self._save_vote(recipe_id, user_id, rating_value):
+                    db.session.commit()
+                    recipe_cache.invalidate_recipe(recipe_id)
+                    return True
+                # Старую оценку успел изменить параллельный запрос - перечитываем
+                db.session.rollback()
+            print(f"Error adding rating: concurrent updates of user {user_id} rating for recipe {recipe_id}")
+            return False
         except Exception as e:
             db.session.rollback()
             print(f"Error adding rating: {e}")
             return False
     
-    def _update_recipe_rating(self, recipe_id):
-        ratings = Rating.query.filter_by(recipe_id=recipe_id).all()
-        if ratings:
-            total_score = sum(r.rating for r in ratings)
-            average_rating = total_score / len(ratings)
-            
-            recipe = Recipe.query.get(recipe_id)
-            if recipe:
-                recipe.rating = round(average_rating, 1)
-                recipe.rating_count = len(ratings)
+    def _save_vote(self, recipe_id, user_id, rating_value):
+        """Записать оценку и сдвинуть агрегаты; False - оценку параллельно изменили, нужен повтор"""
+        table = Rating.__table__
+        # На PostgreSQL строка оценки заблокирована до commit: повторная оценка ждет эту
+        existing_rating = Rating.query.filter_by(
+            user_id=user_id, 
+            recipe_id=recipe_id
+        ).with_for_update().first()
+        
+        if existing_rating:
+            old_rating = existing_rating.rating
+            if old_rating == rating_value:
+                return True
+            # Старое значение сверяется в самом UPDATE (на SQLite FOR UPDATE нет):
+            # иначе два запроса применили бы разницу с одной и той же старой оценкой
+            changed = db.session.execute(
+                table.update().where(
+                    table.c.id == existing_rating.id,
+                    table.c.rating == old_rating
+                ).values(rating=rating_value)
+            ).rowcount
+            if not changed:
+                return False
+        else:
+            old_rating = None
+            db.session.add(Rating(
+                user_id=user_id,
+                recipe_id=recipe_id,
+                rating=rating_value
+            ))
+            try:
+                db.session.flush()
+            except IntegrityError:
+                # Первую оценку пользователя вставил параллельный запрос (unique_user_recipe_rating)
+                return False
+        
+        # Средний рейтинг - по приращению, без чтения всех оценок рецепта
+        self._apply_vote(recipe_id, old_rating, rating_value)
+        return True
+    
+    def _apply_vote(self, recipe_id, old_rating, new_rating):
+        """Одно UPDATE агрегатов: сумма, число, гистограмма и средний рейтинг.
+        
+        Новая оценка: count + 1, sum + new. Смена оценки: count тот же,
+        sum + (new - old), один голос переходит из столбца old в new.
+        """
+        table = Recipe.__table__
+        sum_delta = new_rating - (old_rating or 0)
+        count_delta = 0 if old_rating else 1
+        # В SET справа - значения до UPDATE, поэтому среднее считается по новым сумме и числу
+        new_sum = db.func.coalesce(table.c.rating_sum, 0) + sum_delta
+        new_count = db.func.coalesce(table.c.rating_count, 0) + count_delta
+        values = {
+            'rating_sum': new_sum,
+            'rating_count': new_count,
+            # Смена оценки при рассинхронизированном rating_count = 0 (до backfill) -
+            # без nullif деление на ноль: ошибка на PostgreSQL, NULL на SQLite
+            'rating': db.func.coalesce(db.cast(new_sum, db.Float) / db.func.nullif(new_count, 0), 0),
+        }
+        new_column = table.c[f'rating_{new_rating}']
+        values[new_column.name] = db.func.coalesce(new_column, 0) + 1
+        if old_rating:
+            old_column = table.c[f'rating_{old_rating}']
+            values[old_column.name] = db.func.coalesce(old_column, 0) - 1
+        db.session.execute(table.update().where(table.c.id == recipe_id).values(**values))
+    
+    # Хранимые агрегаты оценок в recipes
+    AGGREGATE_COLUMNS = ('rating_sum', 'rating_count', 'rating_1', 'rating_2', 'rating_3',
+                         'rating_4', 'rating_5', 'rating')
+    
+    def aggregates(self, recipe_ids):
+        """{recipe_id: {колонка: значение}} из ratings одним GROUP BY; у рецептов без оценок - нули"""
+        columns = [
+            Rating.recipe_id,
+            db.func.count(Rating.id).label('rating_count'),
+            db.func.sum(Rating.rating).label('rating_sum'),
+        ] + [
+            db.func.sum(case((Rating.rating == stars, 1), else_=0)).label(f'rating_{stars}')
+            for stars in range(1, 6)
+        ]
+        rows = {
+            row.recipe_id: row for row in db.session.query(*columns).filter(
+                Rating.recipe_id.in_(recipe_ids)
+            ).group_by(Rating.recipe_id)
+        }
+        result = {}
+        for recipe_id in recipe_ids:
+            row = rows.get(recipe_id)
+            values = {
+                column: int(getattr(row, column) or 0) if row else 0
+                for column in self.AGGREGATE_COLUMNS if column != 'rating'
+            }
+            values['rating'] = values['rating_sum'] / values['rating_count'] if values['rating_count'] else 0.0
+            result[recipe_id] = values
+        return result
+    
+    def backfill(self, batch_size=500):
+        """Пересчитать агрегаты оценок всех рецептов из ratings (идемпотентно), пачками по id"""
+        table = Recipe.__table__
+        # Параметры new_* - имена колонок в SET заняты самим UPDATE
+        statement = table.update().where(table.c.id == bindparam('recipe_id')).values(
+            updated_at=table.c.updated_at,
+            **{column: bindparam(f'new_{column}') for column in self.AGGREGATE_COLUMNS}
+        )
+        last_id = 0
+        updated = 0
+        while True:
+            recipe_ids = [row.id for row in db.session.query(Recipe.id).filter(
+                Recipe.id > last_id
+            ).order_by(Recipe.id).limit(batch_size)]
+            if not recipe_ids:
+                break
+            db.session.execute(statement, [
+                {'recipe_id': recipe_id, **{f'new_{column}': value for column, value in values.items()}}
+                for recipe_id, values in self.aggregates(recipe_ids).items()
+            ])
+            db.session.commit()
+            last_id = recipe_ids[-1]
+            updated += len(recipe_ids)
+            print(f"  оценки пересчитаны у {updated} рецептов...")
+        return updated
     
     def get_user_rating(self, recipe_id, user_id):
         rating = Rating.query.filter_by(
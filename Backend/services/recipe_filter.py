@@ -0,0 +1,133 @@
+from datetime import datetime
+from models.db import db
+from models.recipe import Recipe
+from services.pagination import SortOrder, NEWEST
+
+# ?sort= для /api/recipes/filter; NULL в счетчиках считается нулем
+SORT_ORDERS = {
+    'newest': NEWEST,
+    'oldest': SortOrder('created_at', Recipe.created_at, descending=False, parse=datetime.fromisoformat),
+    'rating': SortOrder('rating', db.func.coalesce(Recipe.rating, 0.0), default=0.0),
+    'popular': SortOrder('views', db.func.coalesce(Recipe.views, 0), default=0),
+    'likes': SortOrder('likes', db.func.coalesce(Recipe.likes, 0), default=0),
+    'quickest': SortOrder('cooking_time', db.func.coalesce(Recipe.cooking_time, 0), descending=False, default=0),
+    'title': SortOrder('title', Recipe.title, descending=False),
+}
+
+
+def _int_arg(args, name):
+    value = args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'Invalid {name}')
+
+
+def _float_arg(args, name):
+    value = args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f'Invalid {name}')
+
+
+def _list_arg(args, name):
+    value = args.get(name) or ''
+    items = [item.strip() for item in value.split(',') if item.strip()]
+    return items or None
+
+
+class RecipeFilter:
+    """Условия выборки рецептов, собираемые в один SQL-запрос.
+
+    Все предикаты (включая ингредиенты и текст) идут в WHERE одного SELECT,
+    так что отфильтрованная страница - один запрос к БД.
+    """
+
+    def __init__(self, category=None, difficulty=None, min_cooking_time=None, max_cooking_time=None,
+                 min_servings=None, max_servings=None, include_ingredients=None,
+                 exclude_ingredients=None, author_id=None, author=None, min_rating=None,
+                 text=None, sort='newest'):
+        if sort not in SORT_ORDERS:
+            raise ValueError('Invalid sort')
+        self.category = category or None
+        self.difficulty = difficulty or None
+        self.min_cooking_time = min_cooking_time
+        self.max_cooking_time = max_cooking_time
+        self.min_servings = min_servings
+        self.max_servings = max_servings
+        self.include_ingredients = include_ingredients or None
+        self.exclude_ingredients = exclude_ingredients or None
+        self.author_id = author_id
+        self.author = author or None
+        self.min_rating = min_rating
+        self.text = (text or '').strip() or None
+        self.sort = sort
+
+    @classmethod
+    def from_args(cls, args):
+        """Из query-параметров запроса; ValueError при неверных значениях"""
+        return cls(
+            category=args.get('category'),
+            difficulty=args.get('difficulty'),
+            min_cooking_time=_int_arg(args, 'min_cooking_time'),
+            max_cooking_time=_int_arg(args, 'max_cooking_time'),
+            min_servings=_int_arg(args, 'min_servings'),
+            max_servings=_int_arg(args, 'max_servings'),
+            include_ingredients=_list_arg(args, 'ingredients'),
+            exclude_ingredients=_list_arg(args, 'exclude_ingredients'),
+            author_id=_int_arg(args, 'author_id'),
+            author=args.get('author'),
+            min_rating=_float_arg(args, 'min_rating'),
+            text=args.get('q'),
+            sort=args.get('sort') or 'newest',
+        )
+
+    @property
+    def order(self):
+        return SORT_ORDERS[self.sort]
+
+    def conditions(self, ingredients, search):
+        """Список SQL-условий; ingredients - IngredientService, search - SearchService"""
+        conditions = []
+        if self.category:
+            conditions.append(Recipe.category == self.category)
+        if self.difficulty:
+            conditions.append(Recipe.difficulty == self.difficulty)
+        if self.min_cooking_time is not None:
+            conditions.append(Recipe.cooking_time >= self.min_cooking_time)
+        if self.max_cooking_time is not None:
+            conditions.append(Recipe.cooking_time <= self.max_cooking_time)
+        if self.min_servings is not None:
+            conditions.append(Recipe.servings >= self.min_servings)
+        if self.max_servings is not None:
+            conditions.append(Recipe.servings <= self.max_servings)
+        if self.author_id is not None:
+            conditions.append(Recipe.author_id == self.author_id)
+        if self.author:
+            conditions.append(Recipe.author == self.author)
+        if self.min_rating is not None:
+            conditions.append(Recipe.rating >= self.min_rating)
+        conditions.extend(ingredients.include_filters(self.include_ingredients))
+        exclude_filter = ingredients.exclude_filter(self.exclude_ingredients)
+        if exclude_filter is not None:
+            conditions.append(exclude_filter)
+        if self.text:
+            conditions.append(search.text_condition(self.text))
+        return conditions
+
+    def apply(self, query, ingredients, search):
+        return query.filter(*self.conditions(ingredients, search))
+
+    def is_empty(self):
+        """Нет ни одного условия (сортировка не в счет)"""
+        return not any((
+            self.category, self.difficulty, self.min_cooking_time is not None,
+            self.max_cooking_time is not None, self.min_servings is not None,
+            self.max_servings is not None, self.include_ingredients, self.exclude_ingredients,
+            self.author_id is not None, self.author, self.min_rating is not None, self.text,
+        ))
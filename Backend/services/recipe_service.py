@@ -1,5 +1,19 @@
+from config import Config
 from models.db import db
 from models.recipe import Recipe
+from services.pagination import paginate, iterate_chunks, offset_cursor_mode, NEWEST
+from services.cache_service import recipe_cache
+from services.view_counter import view_counter
+from services.counter_service import counter_service
+from services.singleflight import recipe_flights
+from services.search_service import SearchService
+from services.text_index import recipe_index
+from services.suggest_index import recipe_suggestions
+from services.ingredient_service import IngredientService
+from services.recipe_filter import RecipeFilter
+from services.facet_service import FacetService
+from services.bitmap_index import recipe_bitmaps
+from services.pantry_index import recipe_pantry
 from sqlalchemy import or_
 import os
 import json
@@ -14,6 +28,19 @@ class RecipeService:
         self.ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
         self.UPLOAD_FOLDER = upload_folder or 'uploads/recipes'
         self.use_imgbb = use_imgbb
+        self.cache = recipe_cache
+        self.flights = recipe_flights
+        self.views = view_counter
+        self.counters = counter_service
+        self.search_service = SearchService()
+        self.ingredients = IngredientService()
+        self.facet_service = FacetService()
+        self.recipe_index = recipe_index
+        self.suggestions = recipe_suggestions
+        self.bitmaps = recipe_bitmaps
+        self.pantry = recipe_pantry
+        # Подписчики на изменения рецептов: recipe_saved(recipe) / recipe_deleted(recipe_id)
+        self.listeners = [recipe_index, recipe_suggestions, recipe_bitmaps, recipe_pantry]
         
         print(f"DEBUG: RecipeService initialized. Use ImgBB: {use_imgbb}, Upload folder: {self.UPLOAD_FOLDER}")
         
@@ -26,6 +53,25 @@ class RecipeService:
                 print(f"ERROR: Cannot import ImgBBService: {e}")
                 self.use_imgbb = False
     
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+    
+    def _notify_saved(self, recipe):
+        self.cache.invalidate_facets()
+        for listener in self.listeners:
+            try:
+                listener.recipe_saved(recipe)
+            except Exception as e:
+                print(f"WARNING: Recipe listener {type(listener).__name__} failed: {e}")
+    
+    def _notify_deleted(self, recipe_id):
+        self.cache.invalidate_facets()
+        for listener in self.listeners:
+            try:
+                listener.recipe_deleted(recipe_id)
+            except Exception as e:
+                print(f"WARNING: Recipe listener {type(listener).__name__} failed: {e}")
+    
     def allowed_file(self, filename):
         if not filename or '.' not in filename:
             return False
@@ -170,6 +216,7 @@ class RecipeService:
             
             db.session.add(new_recipe)
             db.session.flush()
+            self.ingredients.sync_recipe(new_recipe)
             
             # Сохраняем изображения шагов если есть
             if step_images:
@@ -186,6 +233,8 @@ class RecipeService:
                             db.session.add(step_image)
             
             db.session.commit()
+            self.cache.invalidate_recipe(new_recipe.id)
+            self._notify_saved(new_recipe)
             self._load_step_images(new_recipe)
             return new_recipe
             
@@ -216,6 +265,7 @@ class RecipeService:
                     recipe.servings = recipe_data['servings']
                 if 'ingredients' in recipe_data:
                     recipe.ingredients = recipe_data['ingredients']
+                    self.ingredients.sync_recipe(recipe)
                 if 'instructions' in recipe_data:
                     recipe.instructions = recipe_data['instructions']
                 
@@ -263,6 +313,8 @@ class RecipeService:
                                 db.session.add(step_image)
                 
                 db.session.commit()
+                self.cache.invalidate_recipe(recipe.id)
+                self._notify_saved(recipe)
                 self._load_step_images(recipe)
                 return recipe
             
@@ -273,16 +325,70 @@ class RecipeService:
             print(f"Error updating recipe with steps: {e}")
             return None        
     
-    def get_all_recipes(self):
-        return Recipe.query.order_by(Recipe.created_at.desc()).all()
+    def _list(self, query, cursor=None, limit=None, fields=None, stream=False, order=NEWEST):
+        """Страница (recipes, next_cursor) или, при stream, (генератор пачек, None)"""
+        if stream:
+            return iterate_chunks(query, fields, order=order), None
+        return paginate(query, cursor, limit, fields, order)
+    
+    def get_all_recipes(self, cursor=None, limit=None, fields=None, stream=False):
+        """Страница всех рецептов: (recipes, next_cursor)"""
+        return self._list(Recipe.query, cursor, limit, fields, stream)
     
     def get_recipe_by_id(self, recipe_id):
         recipe = Recipe.query.get(recipe_id)
         if recipe:
-            recipe.views += 1
-            db.session.commit()
+            self.register_view(recipe_id)
         return recipe
     
+    def register_view(self, recipe_id, viewer=None):
+        """Засчитать просмотр рецепта: в буфер, в БД он попадет со следующим сбросом"""
+        self.views.add(recipe_id, viewer=viewer)
+    
+    def views_count(self, recipe_id, stored_views):
+        """Просмотры для ответа: значение из БД/кэша плюс еще не сброшенные"""
+        return (stored_views or 0) + self.views.pending(recipe_id)
+    
+    def unique_views_count(self, recipe_id, stored_unique_views):
+        """Уникальные зрители для ответа: оценка из БД, но не меньше зрителей из буфера"""
+        return max(stored_unique_views or 0, self.views.unique_pending(recipe_id))
+    
+    def get_recipe_data(self, recipe_id):
+        """Сериализованный рецепт через кэш: {'recipe': dict, 'version': str} или None"""
+        key = self.cache.recipe_key(recipe_id)
+        entry = self.cache.get(key)
+        if entry is None:
+            # Промах (в т.ч. истекшая запись популярного рецепта): одновременные
+            # запросы ждут одну загрузку из БД вместо того, чтобы делать каждый свою
+            entry = self.flights.do(key, lambda: self._load_recipe_data(recipe_id, key))
+        return entry
+    
+    def _load_recipe_data(self, recipe_id, key):
+        # Пока ждали очереди, запись мог положить предыдущий лидер
+        entry = self.cache.local.get(key)
+        if entry is not None:
+            return entry
+        recipe = db.session.get(Recipe, recipe_id)
+        if not recipe:
+            return None
+        entry = {'recipe': recipe.to_dict(), 'version': recipe.etag_source()}
+        self.cache.set(key, entry)
+        return entry
+    
+    def get_collection_version(self):
+        """Версия коллекции рецептов для ETag/Last-Modified списков.
+        
+        Один запрос к recipes: max(updated_at) и число строк ловят создание,
+        изменение и удаление рецептов, а лайки, комментарии, оценки и избранное
+        сдвигают updated_at своего рецепта. views и unique_views в версию не
+        входят (просмотр не трогает updated_at): на 304 клиент оставляет у себя
+        список с прежними счетчиками просмотров до следующего изменения коллекции.
+        """
+        last_modified, recipes_count = db.session.query(
+            db.func.max(Recipe.updated_at), db.func.count(Recipe.id)
+        ).one()
+        return last_modified, f'{last_modified}-{recipes_count}'
+    
     def add_recipe(self, recipe_data, user=None):
         try:
             new_recipe = Recipe(
@@ -300,7 +406,11 @@ class RecipeService:
             )
             
             db.session.add(new_recipe)
+            db.session.flush()
+            self.ingredients.sync_recipe(new_recipe)
             db.session.commit()
+            self.cache.invalidate_recipe(new_recipe.id)
+            self._notify_saved(new_recipe)
             return new_recipe
         except Exception as e:
             db.session.rollback()
@@ -322,8 +432,12 @@ class RecipeService:
                 recipe.category = recipe_data.get('category', recipe.category)
                 recipe.difficulty = recipe_data.get('difficulty', recipe.difficulty)
                 recipe.image_url = recipe_data.get('image_url', recipe.image_url)
+                if 'ingredients' in recipe_data:
+                    self.ingredients.sync_recipe(recipe)
                 
                 db.session.commit()
+                self.cache.invalidate_recipe(recipe_id)
+                self._notify_saved(recipe)
                 return recipe
             return None
         except Exception as e:
@@ -372,6 +486,8 @@ class RecipeService:
                 # Удаляем сам рецепт
                 db.session.delete(recipe)
                 db.session.commit()
+                self.cache.invalidate_recipe(recipe_id)
+                self._notify_deleted(recipe_id)
                 print(f"Recipe {recipe_id} deleted successfully")
                 return True
             
@@ -383,63 +499,107 @@ class RecipeService:
             return False
 
 
-    def search_recipes(self, query):
+    def search_recipes(self, query, cursor=None, limit=None, fields=None, stream=False, fuzzy=None):
+        """Поиск рецептов: (recipes, next_cursor).
+
+        fuzzy=True - только с опечатками, False - только точный, None - точный,
+        а если он ничего не нашел, то с опечатками.
+        """
         if not query:
-            return self.get_all_recipes()
-        
-        query_lower = query.lower()
+            return self.get_all_recipes(cursor, limit, fields, stream)
         
-        # Получаем все рецепты и фильтруем на Python
-        all_recipes = Recipe.query.all()
+        # Следующие страницы нечеткой выдачи берем из нее же
+        if fuzzy or offset_cursor_mode(cursor) == 'fuzzy':
+            return self.fuzzy_search_recipes(query, cursor, limit, fields, stream)
         
-        results = []
-        for recipe in all_recipes:
-            # Ищем в названии (основной поиск)
-            if recipe.title and query_lower in recipe.title.lower():
-                results.append(recipe)
-        
-        # Сортируем по дате
-        results.sort(key=lambda x: x.created_at, reverse=True)
-        
-        return results
+        recipes, next_cursor = self._exact_search(query, cursor, limit, fields, stream)
+        if fuzzy is None and not stream and not cursor and not recipes:
+            return self.fuzzy_search_recipes(query, None, limit, fields)
+        return recipes, next_cursor
     
-    def get_recipes_by_filters(self, category=None, difficulty=None, max_cooking_time=None):
-        query = Recipe.query
-        
-        if category:
-            query = query.filter(Recipe.category == category)
+    def _exact_search(self, query, cursor=None, limit=None, fields=None, stream=False):
+        # Инвертированный индекс в памяти процесса - без полнотекстовых запросов к БД
+        if Config.RECIPE_SEARCH_BACKEND == 'memory':
+            return self.recipe_index.search(query, cursor, limit, fields, stream)
         
-        if difficulty:
-            query = query.filter(Recipe.difficulty == difficulty)
+        # Полнотекстовый индекс по названию, ингредиентам и шагам, с ранжированием
+        if self.search_service.is_available():
+            try:
+                return self.search_service.search(query, cursor, limit, fields, stream)
+            except ValueError:
+                raise
+            except Exception as e:
+                db.session.rollback()
+                print(f"WARNING: Full-text search failed, falling back to title ILIKE: {e}")
         
-        if max_cooking_time:
-            query = query.filter(Recipe.cooking_time <= int(max_cooking_time))
+        # Без индекса (не выполнен upgrade_db.py) - ищем в названии на стороне БД;
+        # % и _ из запроса экранируются, а не работают как шаблоны LIKE
+        return self._list(
+            Recipe.query.filter(Recipe.title.icontains(query, autoescape=True)), cursor, limit, fields, stream
+        )
+    
+    def fuzzy_search_recipes(self, query, cursor=None, limit=None, fields=None, stream=False):
+        """Поиск с опечатками: pg_trgm на PostgreSQL, триграммы индекса в памяти иначе"""
+        if Config.RECIPE_SEARCH_BACKEND != 'memory' and self.search_service.fuzzy_available():
+            try:
+                return self.search_service.fuzzy_search(query, cursor, limit, fields, stream)
+            except ValueError:
+                raise
+            except Exception as e:
+                db.session.rollback()
+                print(f"WARNING: Trigram search failed, using in-memory index: {e}")
+        return self.recipe_index.fuzzy_search(query, cursor, limit, fields, stream)
+    
+    def suggest(self, prefix, limit=10, kinds=None):
+        """Подсказки для строки поиска по началу слова"""
+        return self.suggestions.suggest(prefix, limit, kinds)
+    
+    def match_pantry(self, pantry, cursor=None, limit=None, fields=None, min_coverage=0.0):
+        """Рецепты по доле ингредиентов из pantry: (recipes, matches, next_cursor)"""
+        return self.pantry.match(pantry, cursor, limit, fields, min_coverage)
+    
+    def filter_recipes(self, recipe_filter, cursor=None, limit=None, fields=None, stream=False):
+        """Страница рецептов под RecipeFilter одним запросом: (recipes, next_cursor)"""
+        if Config.RECIPE_BITMAP_INDEX and not stream:
+            # Условия - операции над битмапами в памяти, из БД только страница по id
+            result = self.bitmaps.filter(recipe_filter, cursor, limit, fields)
+            if result is not None:
+                return result
         
-        return query.order_by(Recipe.created_at.desc()).all()
+        query = recipe_filter.apply(Recipe.query, self.ingredients, self.search_service)
+        return self._list(query, cursor, limit, fields, stream, order=recipe_filter.order)
+    
+    def get_recipes_by_filters(self, category=None, difficulty=None, max_cooking_time=None,
+                               include_ingredients=None, exclude_ingredients=None,
+                               cursor=None, limit=None, fields=None, stream=False):
+        recipe_filter = RecipeFilter(
+            category=category,
+            difficulty=difficulty,
+            max_cooking_time=int(max_cooking_time) if max_cooking_time else None,
+            include_ingredients=include_ingredients,
+            exclude_ingredients=exclude_ingredients
+        )
+        return self.filter_recipes(recipe_filter, cursor, limit, fields, stream)
 
     def get_recipes_by_ingredients(self, include_ingredients=None, exclude_ingredients=None):
-        query = Recipe.query
-        
-        if include_ingredients:
-            include_terms = [term.lower() for term in include_ingredients]
-            for term in include_terms:
-                query = query.filter(Recipe.ingredients.ilike(f'%{term}%'))
-        
-        if exclude_ingredients:
-            exclude_terms = [term.lower() for term in exclude_ingredients]
-            for term in exclude_terms:
-                query = query.filter(~Recipe.ingredients.ilike(f'%{term}%'))
-        
+        # Полу- и антисоединения с recipe_ingredients по индексам
+        recipe_filter = RecipeFilter(
+            include_ingredients=include_ingredients,
+            exclude_ingredients=exclude_ingredients
+        )
+        query = recipe_filter.apply(Recipe.query, self.ingredients, self.search_service)
         return query.order_by(Recipe.created_at.desc()).all()
        
     def increment_likes(self, recipe_id):
         try:
-            recipe = Recipe.query.get(recipe_id)
-            if recipe:
-                recipe.likes += 1
-                db.session.commit()
-                return recipe
-            return None
+            if self.counters.increment(recipe_id, 'likes') is None:
+                db.session.rollback()
+                return None
+            db.session.commit()
+            # Только кэш рецепта: лайк не меняет текст и фильтруемые поля, а вес
+            # подсказок по likes догонит периодическая перестройка, как и по views
+            self.cache.invalidate_recipe(recipe_id)
+            return db.session.get(Recipe, recipe_id)
         except Exception as e:
             db.session.rollback()
             print(f"Error incrementing likes: {e}")
@@ -454,13 +614,37 @@ class RecipeService:
     def get_recipes_by_author(self, author_id):
         return Recipe.query.filter_by(author_id=author_id).order_by(Recipe.created_at.desc()).all()
     
+    def get_facets(self, recipe_filter=None):
+        """Счетчики категорий, сложности и интервалов времени для набора условий.
+        
+        Без условий результат кэшируется до следующей записи рецептов.
+        """
+        if Config.RECIPE_BITMAP_INDEX:
+            # Счетчики - popcount пересечений битмапов, без запроса к БД
+            facets = self.bitmaps.facets(recipe_filter or RecipeFilter())
+            if facets is not None:
+                return facets
+        
+        if recipe_filter is not None and not recipe_filter.is_empty():
+            return self.facet_service.facets(recipe_filter, self.ingredients, self.search_service)
+        
+        facets = self.cache.get(self.cache.FACETS_KEY)
+        if facets is None:
+            facets = self.flights.do(self.cache.FACETS_KEY, self._load_facets)
+        return facets
+    
+    def _load_facets(self):
+        facets = self.facet_service.facets()
+        self.cache.set(self.cache.FACETS_KEY, facets)
+        return facets
+    
     def get_categories(self):
-        categories = db.session.query(Recipe.category).distinct().all()
-        return [cat[0] for cat in categories if cat[0]]
+        # Категории по убыванию числа рецептов, из кэша счетчиков
+        return [item['value'] for item in self.get_facets()['category']]
     
-    def get_user_recipes(self, user_id):
-        """Получить рецепты пользователя"""
-        return Recipe.query.filter_by(author_id=user_id).order_by(Recipe.created_at.desc()).all()
+    def get_user_recipes(self, user_id, cursor=None, limit=None, fields=None):
+        """Получить страницу рецептов пользователя: (recipes, next_cursor)"""
+        return paginate(Recipe.query.filter_by(author_id=user_id), cursor, limit, fields)
     
 
     def _load_step_images(self, recipe):
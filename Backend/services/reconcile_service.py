@@ -0,0 +1,187 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import bindparam, and_, select
+from models.db import db
+from models.recipe import Recipe
+from services.cache_service import recipe_cache
+from services.comment_service import CommentService
+from services.favorite_service import FavoriteService
+from services.rating_service import RatingService
+
+
+class ReconcileService:
+    """Сверка денормализованных счетчиков recipes с исходными таблицами.
+
+    Идет пачками по id: для пачки одним GROUP BY на таблицу считаются
+    ожидаемые значения, сравниваются с хранимыми, и UPDATE получают только
+    разошедшиеся строки. Каждая пачка - своя короткая транзакция.
+    UPDATE условный (WHERE колонка = прочитанное значение): если счетчик
+    успели изменить параллельно, строка пропускается до следующего прогона.
+
+    У views и likes нет исходной таблицы - для них только NULL и
+    отрицательные значения приводятся к 0.
+    """
+
+    SOURCES = ('comments', 'ratings', 'favorites')
+    UNSOURCED = ('views', 'likes')
+    # Ключ pg_try_advisory_lock: одна сверка на всю БД, сколько бы воркеров ни держали расписание
+    ADVISORY_LOCK_KEY = 0x7265636f
+
+    def __init__(self):
+        self.comments = CommentService()
+        self.ratings = RatingService()
+        self.favorites = FavoriteService()
+
+    def columns(self):
+        return ('comments_count', 'favorites_count') + RatingService.AGGREGATE_COLUMNS + self.UNSOURCED
+
+    def _expected(self, stored):
+        recipe_ids = list(stored)
+        comments = self.comments.counts(recipe_ids)
+        favorites = self.favorites.counts(recipe_ids)
+        ratings = self.ratings.aggregates(recipe_ids)
+        expected = {}
+        for recipe_id, row in stored.items():
+            values = {'comments_count': comments[recipe_id], 'favorites_count': favorites[recipe_id]}
+            values.update(ratings[recipe_id])
+            for column in self.UNSOURCED:
+                values[column] = max(row[column] or 0, 0)
+            expected[recipe_id] = values
+        return expected
+
+    @staticmethod
+    def _differs(stored, expected):
+        if stored is None:
+            return True
+        if isinstance(expected, float):
+            return abs(stored - expected) > 1e-9
+        return stored != expected
+
+    def _update(self, column_set, rows):
+        """Одна executemany для строк с одинаковым набором разошедшихся колонок"""
+        table = Recipe.__table__
+        statement = table.update().where(and_(
+            table.c.id == bindparam('recipe_id'),
+            *(table.c[column].is_not_distinct_from(bindparam(f'old_{column}')) for column in column_set)
+        )).values(
+            updated_at=table.c.updated_at,
+            **{column: bindparam(f'new_{column}') for column in column_set}
+        )
+        db.session.execute(statement, rows)
+
+    def reconcile(self, batch_size=500, dry_run=False, max_changes=50):
+        """Сверить все рецепты; отчет {'checked', 'drifted', 'columns': {колонка: n}, 'changes': [...]}"""
+        columns = self.columns()
+        report = {'checked': 0, 'drifted': 0, 'columns': {}, 'changes': [], 'dry_run': dry_run}
+        last_id = 0
+        while True:
+            rows = db.session.query(Recipe.id, *(getattr(Recipe, column) for column in columns)).filter(
+                Recipe.id > last_id
+            ).order_by(Recipe.id).limit(batch_size).all()
+            if not rows:
+                break
+            stored = {row.id: row._mapping for row in rows}
+            expected = self._expected(stored)
+
+            groups = {}
+            for recipe_id, values in expected.items():
+                drifted = tuple(
+                    column for column in columns
+                    if self._differs(stored[recipe_id][column], values[column])
+                )
+                if not drifted:
+                    continue
+                report['drifted'] += 1
+                for column in drifted:
+                    report['columns'][column] = report['columns'].get(column, 0) + 1
+                    if len(report['changes']) < max_changes:
+                        report['changes'].append({
+                            'recipe_id': recipe_id,
+                            'column': column,
+                            'stored': stored[recipe_id][column],
+                            'expected': values[column],
+                        })
+                groups.setdefault(drifted, []).append({
+                    'recipe_id': recipe_id,
+                    **{f'old_{column}': stored[recipe_id][column] for column in drifted},
+                    **{f'new_{column}': values[column] for column in drifted},
+                })
+
+            if groups and not dry_run:
+                for column_set, group_rows in groups.items():
+                    self._update(column_set, group_rows)
+                db.session.commit()
+                for group_rows in groups.values():
+                    for row in group_rows:
+                        recipe_cache.invalidate_recipe(row['recipe_id'])
+            else:
+                # Закрываем читающую транзакцию пачки
+                db.session.rollback()
+
+            last_id = rows[-1].id
+            report['checked'] += len(rows)
+        return report
+
+    @contextmanager
+    def exclusive(self):
+        """Блокировка сверки: True - получена, False - сверка уже идет в другом процессе.
+
+        PostgreSQL - advisory-блокировка на отдельном соединении, снимается и при
+        падении процесса. SQLite - flock файла рядом с временными файлами: все
+        воркеры с одной базой SQLite на одной машине.
+        """
+        if db.engine.dialect.name == 'postgresql':
+            with db.engine.connect() as connection:
+                acquired = connection.execute(select(db.func.pg_try_advisory_lock(self.ADVISORY_LOCK_KEY))).scalar()
+                try:
+                    yield acquired
+                finally:
+                    if acquired:
+                        connection.execute(select(db.func.pg_advisory_unlock(self.ADVISORY_LOCK_KEY)))
+            return
+        try:
+            import fcntl
+        except ImportError:
+            # Windows: разработка в одном процессе, делить сверку не с кем
+            yield True
+            return
+        name = hashlib.md5(str(db.engine.url).encode()).hexdigest()[:12]
+        with open(os.path.join(tempfile.gettempdir(), f'recipe-reconcile-{name}.lock'), 'w') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def start_schedule(self, app, interval, batch_size=500):
+        """Фоновая сверка раз в interval секунд (первая - через interval после старта).
+
+        Запускается в каждом воркере, но прогон делает тот, кто взял exclusive().
+        """
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    with app.app_context(), self.exclusive() as acquired:
+                        if not acquired:
+                            # Расписание есть в каждом воркере gunicorn, сверяет один
+                            continue
+                        started = time.perf_counter()
+                        report = self.reconcile(batch_size)
+                        print(f"DEBUG: Counters reconciled: {report['checked']} recipes checked, "
+                              f"{report['drifted']} fixed {report['columns']} "
+                              f"in {time.perf_counter() - started:.1f}s")
+                except Exception as e:
+                    print(f"WARNING: Counter reconciliation failed: {e}")
+
+        thread = threading.Thread(target=run, name='counter-reconcile', daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,220 @@
+import re
+from sqlalchemy import text, inspect, column, false
+from config import Config
+from models.db import db
+from models.recipe import Recipe
+from services.pagination import paginate_ranked, iterate_ranked_chunks
+
+# PostgreSQL: tsvector как генерируемая колонка - синхронна с INSERT/UPDATE сама,
+# русская и английская конфигурации, веса: название > ингредиенты > шаги
+POSTGRES_DDL = [
+    """
+    ALTER TABLE recipes ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('russian', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(jsonb_to_tsvector('russian', coalesce(ingredients, '[]'::jsonb), '["string"]'), 'B') ||
+        setweight(jsonb_to_tsvector('english', coalesce(ingredients, '[]'::jsonb), '["string"]'), 'B') ||
+        setweight(jsonb_to_tsvector('russian', coalesce(instructions, '[]'::jsonb), '["string"]'), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_recipes_search_vector ON recipes USING GIN (search_vector)",
+]
+
+# PostgreSQL: триграммные GIN-индексы для поиска с опечатками (pg_trgm)
+INGREDIENT_NAMES_SQL = "lower(jsonb_path_query_array(ingredients, '$[*].name')::text)"
+POSTGRES_TRIGRAM_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_recipes_title_trgm ON recipes USING GIN (lower(title) gin_trgm_ops)",
+    f"CREATE INDEX IF NOT EXISTS ix_recipes_ingredient_names_trgm ON recipes "
+    f"USING GIN (({INGREDIENT_NAMES_SQL}) gin_trgm_ops)",
+]
+
+# SQLite: FTS5-таблица поверх recipes, синхронизируется триггерами
+SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS recipes_fts USING fts5(
+        title, ingredients, instructions,
+        content='recipes', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS recipes_fts_ai AFTER INSERT ON recipes BEGIN
+        INSERT INTO recipes_fts (rowid, title, ingredients, instructions)
+        VALUES (new.id, new.title, new.ingredients, new.instructions);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS recipes_fts_ad AFTER DELETE ON recipes BEGIN
+        INSERT INTO recipes_fts (recipes_fts, rowid, title, ingredients, instructions)
+        VALUES ('delete', old.id, old.title, old.ingredients, old.instructions);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS recipes_fts_au
+    AFTER UPDATE OF title, ingredients, instructions ON recipes BEGIN
+        INSERT INTO recipes_fts (recipes_fts, rowid, title, ingredients, instructions)
+        VALUES ('delete', old.id, old.title, old.ingredients, old.instructions);
+        INSERT INTO recipes_fts (rowid, title, ingredients, instructions)
+        VALUES (new.id, new.title, new.ingredients, new.instructions);
+    END
+    """,
+]
+
+
+class SearchService:
+    """Полнотекстовый поиск рецептов средствами БД с ранжированием"""
+
+    def __init__(self):
+        self._available = None
+        self._fuzzy_available = None
+
+    @property
+    def is_postgres(self):
+        return db.engine.dialect.name == 'postgresql'
+
+    def ensure_index(self):
+        """Создать полнотекстовый индекс (идемпотентно).
+
+        На PostgreSQL добавление генерируемой колонки перезаписывает таблицу -
+        запускать из upgrade_db.py, а не на горячей БД.
+        """
+        for statement in (POSTGRES_DDL if self.is_postgres else SQLITE_DDL):
+            db.session.execute(text(statement))
+        if not self.is_postgres:
+            # Заполнить FTS5 по уже существующим рецептам
+            db.session.execute(text("INSERT INTO recipes_fts (recipes_fts) VALUES ('rebuild')"))
+        db.session.commit()
+        self._available = True
+        if self.is_postgres:
+            self.ensure_trigram_index()
+
+    def ensure_trigram_index(self):
+        """pg_trgm и триграммные индексы; на SQLite нечеткий поиск идет по индексу в памяти"""
+        try:
+            for statement in POSTGRES_TRIGRAM_DDL:
+                db.session.execute(text(statement))
+            db.session.commit()
+            self._fuzzy_available = True
+        except Exception as e:
+            # CREATE EXTENSION может быть запрещен правами - полнотекстовый поиск это не ломает
+            db.session.rollback()
+            self._fuzzy_available = False
+            print(f"WARNING: pg_trgm indexes not created: {e}")
+
+    def is_available(self):
+        """Есть ли в БД полнотекстовый индекс (проверяется один раз на процесс)"""
+        if self._available is None:
+            inspector = inspect(db.engine)
+            if self.is_postgres:
+                columns = {column['name'] for column in inspector.get_columns('recipes')}
+                self._available = 'search_vector' in columns
+            else:
+                self._available = 'recipes_fts' in inspector.get_table_names()
+        return self._available
+
+    def fuzzy_available(self):
+        """Есть ли pg_trgm (только PostgreSQL; проверяется один раз на процесс)"""
+        if self._fuzzy_available is None:
+            self._fuzzy_available = self.is_postgres and db.session.execute(
+                text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            ).first() is not None
+        return self._fuzzy_available
+
+    @staticmethod
+    def _fts5_query(query_text):
+        # Пользовательский ввод не передаем в MATCH как есть: только слова,
+        # каждое как префикс, все обязательны
+        terms = re.findall(r'\w+', query_text.lower())
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def text_condition(self, query_text):
+        """Условие "рецепт подходит под текст" для WHERE общего запроса (без ранжирования)"""
+        if not self.is_available():
+            return Recipe.title.icontains(query_text, autoescape=True)
+        if self.is_postgres:
+            return text(
+                "recipes.search_vector @@ (websearch_to_tsquery('russian', :text_query) || "
+                "websearch_to_tsquery('english', :text_query))"
+            ).bindparams(text_query=query_text)
+        match = self._fts5_query(query_text)
+        if not match:
+            return false()
+        return Recipe.id.in_(
+            text("SELECT rowid FROM recipes_fts WHERE recipes_fts MATCH :text_query")
+            .bindparams(text_query=match)
+            .columns(column('rowid'))
+        )
+
+    def ranked_ids(self, query_text, offset=0, limit=None):
+        """[(recipe_id, rank)] по убыванию релевантности"""
+        params = {'q': query_text, 'offset': offset, 'limit': limit if limit is not None else -1}
+        if self.is_postgres:
+            sql = """
+                SELECT recipes.id, ts_rank_cd(recipes.search_vector, q.query) AS rank
+                FROM recipes,
+                     (SELECT websearch_to_tsquery('russian', :q) ||
+                             websearch_to_tsquery('english', :q) AS query) AS q
+                WHERE recipes.search_vector @@ q.query
+                ORDER BY rank DESC, recipes.id DESC
+            """
+            sql += " LIMIT :limit OFFSET :offset" if limit is not None else " OFFSET :offset"
+        else:
+            params['q'] = self._fts5_query(query_text)
+            if not params['q']:
+                return []
+            # bm25: чем меньше, тем релевантнее; веса колонок title, ingredients, instructions
+            sql = """
+                SELECT rowid, -bm25(recipes_fts, 10.0, 3.0, 1.0) AS rank
+                FROM recipes_fts
+                WHERE recipes_fts MATCH :q
+                ORDER BY rank DESC, rowid DESC
+                LIMIT :limit OFFSET :offset
+            """
+        return [tuple(row) for row in db.session.execute(text(sql), params)]
+
+    def fuzzy_ranked_ids(self, query_text, threshold, offset=0, limit=None):
+        """[(recipe_id, similarity)] по названию и ингредиентам с учетом опечаток.
+
+        Операторы <% идут по триграммным GIN-индексам, порог задается
+        pg_trgm.word_similarity_threshold на время транзакции.
+        """
+        db.session.execute(
+            text("SELECT set_config('pg_trgm.word_similarity_threshold', :threshold, true)"),
+            {'threshold': str(threshold)}
+        )
+        sql = f"""
+            SELECT id, GREATEST(
+                word_similarity(:q, lower(title)),
+                word_similarity(:q, {INGREDIENT_NAMES_SQL})
+            ) AS score
+            FROM recipes
+            WHERE :q <% lower(title) OR :q <% {INGREDIENT_NAMES_SQL}
+            ORDER BY score DESC, id DESC
+        """
+        sql += " LIMIT :limit OFFSET :offset" if limit is not None else " OFFSET :offset"
+        params = {'q': query_text.lower(), 'offset': offset, 'limit': limit}
+        return [tuple(row) for row in db.session.execute(text(sql), params)]
+
+    def search(self, query_text, cursor=None, limit=None, fields=None, stream=False):
+        """Страница результатов по релевантности: (recipes, next_cursor)"""
+        if stream:
+            recipe_ids = [recipe_id for recipe_id, _ in self.ranked_ids(query_text)]
+            return iterate_ranked_chunks(recipe_ids, fields), None
+        return paginate_ranked(
+            lambda offset, limit: self.ranked_ids(query_text, offset, limit),
+            cursor, limit, fields
+        )
+
+    def fuzzy_search(self, query_text, cursor=None, limit=None, fields=None, stream=False,
+                     threshold=None):
+        """Как search, но по триграммному сходству (pg_trgm)"""
+        threshold = threshold if threshold is not None else Config.RECIPE_FUZZY_THRESHOLD
+        if stream:
+            recipe_ids = [recipe_id for recipe_id, _ in self.fuzzy_ranked_ids(query_text, threshold)]
+            return iterate_ranked_chunks(recipe_ids, fields), None
+        return paginate_ranked(
+            lambda offset, limit: self.fuzzy_ranked_ids(query_text, threshold, offset, limit),
+            cursor, limit, fields, mode='fuzzy'
+        )
@@ -0,0 +1,367 @@
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete
+from config import Config
+from models.db import db
+from models.user import UserSession
+
+
+class ServerSessionStore:
+    """Общее у серверных хранилищ: сессия - случайный id, по которому хранится user_id"""
+
+    def issue(self, user_id):
+        """Новая сессия пользователя; возвращает значение для cookie session_id"""
+        session_id = str(uuid.uuid4())
+        self.create(session_id, user_id)
+        return session_id
+
+
+class MemorySessionStore(ServerSessionStore):
+    """Сессии в памяти процесса: TTL от входа + LRU-вытеснение по числу сессий.
+
+    Видны только своему воркеру и теряются при перезапуске - для одного
+    процесса и разработки.
+    """
+
+    name = 'memory'
+
+    def __init__(self, ttl, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._sessions = OrderedDict()  # session_id -> (expires_at, user_id)
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def create(self, session_id, user_id):
+        with self._lock:
+            self._sessions[session_id] = (time.monotonic() + self.ttl, user_id)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            expires_at, user_id = entry
+            if expires_at < time.monotonic():
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            return user_id
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def sweep(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [session_id for session_id, (expires_at, _) in self._sessions.items() if expires_at < now]
+            for session_id in expired:
+                del self._sessions[session_id]
+        return len(expired)
+
+    def stats(self):
+        return {'sessions': len(self._sessions), 'max_entries': self.max_entries, 'evictions': self.evictions}
+
+
+class DatabaseSessionStore(ServerSessionStore):
+    """Сессии в таблице user_sessions (PostgreSQL или SQLite): общие для всех воркеров.
+
+    Поиск - по первичному ключу. Просроченные строки удаляются пачками по
+    индексу expires_at не чаще раза в sweep_interval секунд, попутно с
+    созданием сессий, - отдельный планировщик не нужен.
+    """
+
+    name = 'db'
+    SWEEP_BATCH_SIZE = 1000
+
+    def __init__(self, ttl, sweep_interval=3600):
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._last_sweep = time.monotonic()
+        self._sweep_lock = threading.Lock()
+        self.swept = 0
+
+    def create(self, session_id, user_id):
+        # Отдельное соединение: сессия не должна зависеть от транзакции запроса
+        with db.engine.begin() as connection:
+            connection.execute(UserSession.__table__.insert().values(
+                id=session_id,
+                user_id=user_id,
+                created_at=datetime.utcnow(),
+                expires_at=datetime.utcnow() + timedelta(seconds=self.ttl)
+            ))
+        if time.monotonic() - self._last_sweep > self.sweep_interval:
+            self.sweep()
+
+    def get(self, session_id):
+        table = UserSession.__table__
+        with db.engine.connect() as connection:
+            return connection.execute(
+                select(table.c.user_id).where(table.c.id == session_id, table.c.expires_at > datetime.utcnow())
+            ).scalar()
+
+    def delete(self, session_id):
+        table = UserSession.__table__
+        with db.engine.begin() as connection:
+            connection.execute(delete(table).where(table.c.id == session_id))
+
+    def sweep(self):
+        """Удалить просроченные сессии пачками - без долгой блокировки таблицы"""
+        if not self._sweep_lock.acquire(blocking=False):
+            return 0
+        try:
+            self._last_sweep = time.monotonic()
+            table = UserSession.__table__
+            removed = 0
+            while True:
+                expired = select(table.c.id).where(
+                    table.c.expires_at <= datetime.utcnow()
+                ).limit(self.SWEEP_BATCH_SIZE).scalar_subquery()
+                with db.engine.begin() as connection:
+                    deleted = connection.execute(delete(table).where(table.c.id.in_(expired))).rowcount
+                removed += deleted
+                if deleted < self.SWEEP_BATCH_SIZE:
+                    break
+            self.swept += removed
+            return removed
+        finally:
+            self._sweep_lock.release()
+
+    def stats(self):
+        with db.engine.connect() as connection:
+            sessions = connection.execute(select(db.func.count()).select_from(UserSession.__table__)).scalar()
+        return {'sessions': sessions, 'swept': self.swept, 'sweep_interval': self.sweep_interval}
+
+
+class RedisSessionStore(ServerSessionStore):
+    """Сессии на Redis-совместимом сервере (нужен пакет redis): TTL ставит сам сервер"""
+
+    name = 'redis'
+
+    def __init__(self, url, ttl, prefix='session:'):
+        import redis  # необязательная зависимость
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.client.ping()
+
+    def _key(self, session_id):
+        return f'{self.prefix}{session_id}'
+
+    def create(self, session_id, user_id):
+        self.client.set(self._key(session_id), user_id, ex=self.ttl)
+
+    def get(self, session_id):
+        value = self.client.get(self._key(session_id))
+        return int(value) if value is not None else None
+
+    def delete(self, session_id):
+        self.client.delete(self._key(session_id))
+
+    def sweep(self):
+        return 0  # истекшие ключи удаляет Redis
+
+    def stats(self):
+        return {'ttl': self.ttl}
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(value):
+    return base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+
+
+class MemoryDenylist:
+    """Отозванные токены в памяти процесса: jti -> срок действия токена.
+
+    Запись нужна только до истечения токена - потом он и так не пройдет
+    проверку, поэтому список не растет дольше SESSION_TTL.
+    """
+
+    name = 'memory'
+
+    def __init__(self):
+        self._revoked = {}
+        self._lock = threading.Lock()
+        self._next_prune = time.time() + 60
+
+    def add(self, jti, expires_at):
+        with self._lock:
+            self._revoked[jti] = expires_at
+            now = time.time()
+            if now > self._next_prune:
+                self._revoked = {key: exp for key, exp in self._revoked.items() if exp > now}
+                self._next_prune = now + 60
+
+    def __contains__(self, jti):
+        with self._lock:
+            return jti in self._revoked
+
+    def __len__(self):
+        return len(self._revoked)
+
+
+class RedisDenylist:
+    """Отозванные токены на Redis: общие для всех воркеров и узлов, истекают вместе с токеном"""
+
+    name = 'redis'
+
+    def __init__(self, url, prefix='revoked:'):
+        import redis  # необязательная зависимость
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5)
+        self.prefix = prefix
+        self.client.ping()
+
+    def add(self, jti, expires_at):
+        self.client.set(f'{self.prefix}{jti}', 1, exat=int(expires_at) + 1)
+
+    def __contains__(self, jti):
+        return bool(self.client.exists(f'{self.prefix}{jti}'))
+
+    def __len__(self):
+        return -1  # не считаем, чтобы не сканировать ключи
+
+
+class SignedSessionStore:
+    """Сессия без состояния на сервере: cookie - подписанный HMAC-SHA256 токен.
+
+    Токен payload.signature: в payload (base64url JSON) id пользователя,
+    время выдачи, срок действия, jti для отзыва и kid - отпечаток ключа.
+    Проверка - только вычисление подписи, без общего хранилища. Отзыв
+    (выход) кладет jti в denylist до истечения токена.
+
+    Ротация ключей: первый из keys подписывает, проверка идет по любому
+    из них, так что старый ключ можно держать в списке до истечения
+    выданных им токенов.
+    """
+
+    name = 'signed'
+
+    # Значения по умолчанию из config.py опубликованы вместе с кодом:
+    # подписанный ими токен может подделать кто угодно для любого uid
+    INSECURE_KEYS = frozenset({'dev-secret-key-change-in-production', 'dev-jwt-secret-key-change-in-production'})
+
+    def __init__(self, keys, ttl, denylist=None):
+        keys = [key for key in keys if key and key.strip()]
+        if not keys:
+            raise ValueError('Signing key is required')
+        if any(key in self.INSECURE_KEYS for key in keys):
+            raise ValueError('Default signing key is not allowed: set SESSION_SIGNING_KEYS')
+        self.ttl = ttl
+        self.denylist = denylist if denylist is not None else MemoryDenylist()
+        self._keys = {self._kid(key): key.encode('utf-8') for key in keys}
+        self._signing_kid = self._kid(keys[0])
+
+    @staticmethod
+    def _kid(key):
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()[:8]
+
+    def _sign(self, kid, payload):
+        return _b64encode(hmac.new(self._keys[kid], payload.encode('ascii'), hashlib.sha256).digest())
+
+    def issue(self, user_id):
+        now = int(time.time())
+        claims = {
+            'uid': user_id,
+            'iat': now,
+            'exp': now + self.ttl,
+            'jti': _b64encode(secrets.token_bytes(12)),
+            'kid': self._signing_kid,
+        }
+        payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+        return f'{payload}.{self._sign(self._signing_kid, payload)}'
+
+    def claims(self, token):
+        """Проверенные поля токена или None (чужая подпись, истек, отозван, испорчен)"""
+        try:
+            payload, signature = token.split('.')
+            claims = json.loads(_b64decode(payload))
+            kid = claims['kid']
+            if kid not in self._keys:
+                return None
+            if not hmac.compare_digest(signature, self._sign(kid, payload)):
+                return None
+            if claims['exp'] <= time.time():
+                return None
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return None
+        if claims['jti'] in self.denylist:
+            return None
+        return claims
+
+    def get(self, token):
+        claims = self.claims(token)
+        return claims['uid'] if claims else None
+
+    def delete(self, token):
+        claims = self.claims(token)
+        if claims:
+            self.denylist.add(claims['jti'], claims['exp'])
+
+    def sweep(self):
+        return 0
+
+    def stats(self):
+        return {
+            'ttl': self.ttl,
+            'keys': len(self._keys),
+            'signing_kid': self._signing_kid,
+            'denylist': self.denylist.name,
+            'revoked': len(self.denylist),
+        }
+
+
+def signing_keys(config=Config):
+    """SESSION_SIGNING_KEYS (через запятую, первый - текущий), иначе JWT_SECRET_KEY"""
+    if config.SESSION_SIGNING_KEYS:
+        return [key.strip() for key in config.SESSION_SIGNING_KEYS.split(',') if key.strip()]
+    return [config.JWT_SECRET_KEY or config.SECRET_KEY]
+
+
+def create_denylist(config=Config):
+    """Список отозванных токенов; недоступный Redis - ошибка, а не память процесса.
+
+    С памятью процесса выход отзывал бы токен только в одном воркере.
+    """
+    if config.SESSION_DENYLIST_BACKEND == 'redis':
+        return RedisDenylist(config.SESSION_REDIS_URL)
+    if config.SESSION_DENYLIST_BACKEND == 'memory':
+        return MemoryDenylist()
+    raise ValueError(f'Unknown SESSION_DENYLIST_BACKEND: {config.SESSION_DENYLIST_BACKEND}')
+
+
+def create_session_store(config=Config):
+    """Хранилище сессий по SESSION_BACKEND.
+
+    Недоступный Redis - ошибка запуска, а не тихий переход на память процесса:
+    с несколькими воркерами вход снова работал бы только в том воркере,
+    который выдал сессию.
+    """
+    backend = config.SESSION_BACKEND
+    if backend == 'memory':
+        return MemorySessionStore(config.SESSION_TTL, config.SESSION_MAX_ENTRIES)
+    if backend == 'db':
+        return DatabaseSessionStore(config.SESSION_TTL, config.SESSION_SWEEP_INTERVAL)
+    try:
+        if backend == 'signed':
+            return SignedSessionStore(signing_keys(config), config.SESSION_TTL, create_denylist(config))
+        if backend == 'redis':
+            return RedisSessionStore(config.SESSION_REDIS_URL, config.SESSION_TTL)
+    except Exception as e:
+        raise RuntimeError(f"Session store '{backend}' is unavailable: {e}") from e
+    raise ValueError(f'Unknown SESSION_BACKEND: {backend}')
@@ -0,0 +1,63 @@
+import threading
+
+
+class _Call:
+    """Одно вычисление в полете: результат ждут все запросы с тем же ключом"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Схлопывание одновременных одинаковых вычислений по ключу.
+
+    Первый запрос с ключом (лидер) выполняет функцию, остальные, пришедшие пока
+    она выполняется, ждут и получают тот же результат (или ту же ошибку).
+    Работает в пределах процесса - между потоками одного воркера.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {'executed': 0, 'shared': 0}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self._stats['shared'] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._stats['executed'] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._calls)
+        return stats
+
+
+# Общий на процесс, как и recipe_cache
+recipe_flights = SingleFlight()
@@ -0,0 +1,233 @@
+import heapq
+import sys
+import threading
+from config import Config
+from services.text_index import RecipeIndex, ingredient_names, normalize, tokenize
+
+
+class _Node:
+    __slots__ = ('children', 'entries', 'top')
+
+    def __init__(self):
+        self.children = {}
+        self.entries = None  # подсказки, в которых есть слово, заканчивающееся здесь
+        self.top = ()        # лучшие по весу подсказки всего поддерева
+
+
+class PrefixTrie:
+    """Префиксное дерево слов подсказок.
+
+    Подсказка (например название рецепта) вставляется под каждым своим словом,
+    так что 'карб' находит 'Спагетти карбонара'. В каждом узле хранится top_size
+    лучших подсказок поддерева - ответ на префикс не требует обхода поддерева.
+    При изменении веса пересчитываются только узлы на пути его слов.
+    """
+
+    def __init__(self, top_size=50):
+        self.top_size = top_size
+        self.root = _Node()
+        self.weights = {}  # подсказка -> вес
+        self._words = {}   # подсказка -> ее слова
+        self.nodes = 1
+        self.deferred = False  # при сборке top пересчитывается один раз в конце
+
+    def _path(self, word):
+        nodes = [self.root]
+        for char in word:
+            child = nodes[-1].children.get(char)
+            if child is None:
+                child = nodes[-1].children[char] = _Node()
+                self.nodes += 1
+            nodes.append(child)
+        return nodes
+
+    def _top(self, node):
+        candidates = set(node.entries or ())
+        for child in node.children.values():
+            candidates.update(child.top)
+        weights = self.weights
+        # В top соседних веток еще может лежать удаленная подсказка - их пересчитают следом
+        candidates = [entry for entry in candidates if entry in weights]
+        return tuple(heapq.nlargest(self.top_size, candidates, key=lambda entry: (weights[entry], entry)))
+
+    def update(self, entry, words, weight):
+        """Задать вес подсказки; вес 0 удаляет ее"""
+        old_words = self._words.pop(entry, ())
+        self.weights.pop(entry, None)
+        if weight > 0:
+            self.weights[entry] = weight
+            self._words[entry] = words
+
+        for word in set(old_words) | set(words):
+            path = self._path(word)
+            terminal = path[-1]
+            if weight > 0 and word in words:
+                if terminal.entries is None:
+                    terminal.entries = set()
+                terminal.entries.add(entry)
+            elif terminal.entries is not None:
+                terminal.entries.discard(entry)
+                if not terminal.entries:
+                    terminal.entries = None
+            if self.deferred:
+                continue
+            for depth in range(len(path) - 1, -1, -1):
+                node = path[depth]
+                node.top = self._top(node)
+                # Пустые ветки удаляем, чтобы дерево не росло от правок
+                if depth and not node.children and node.entries is None:
+                    del path[depth - 1].children[word[depth - 1]]
+                    self.nodes -= 1
+
+    def rebuild_tops(self):
+        """Пересчитать top во всем дереве снизу вверх (после сборки с deferred)"""
+        stack = [(self.root, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if children_done:
+                node.top = self._top(node)
+            else:
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children.values())
+        self.deferred = False
+
+    def find(self, prefix):
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
+
+    def words_of(self, entry):
+        return self._words.get(entry, ())
+
+    def memory_usage(self):
+        size = sys.getsizeof(self.weights) + sys.getsizeof(self._words)
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            size += sys.getsizeof(node) + sys.getsizeof(node.children) + sys.getsizeof(node.top)
+            if node.entries is not None:
+                size += sys.getsizeof(node.entries)
+            stack.extend(node.children.values())
+        return size
+
+
+class SuggestIndex:
+    """Подсказки для строки поиска: названия, категории и ингредиенты с весами.
+
+    Вес подсказки - сумма популярности рецептов, в которых она встречается,
+    поэтому частые ингредиенты и категории поднимаются выше редких.
+    """
+
+    KINDS = ('title', 'category', 'ingredient')
+
+    def __init__(self, top_size=50):
+        self.trie = PrefixTrie(top_size)
+        self._display = {}       # подсказка -> текст для показа
+        self._contributions = {}  # recipe_id -> {подсказка: вклад в вес}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._contributions)
+
+    def add(self, recipe_id, document):
+        contributions = {}
+        texts = [('title', document['title']), ('category', document['category'])]
+        texts += [('ingredient', name) for name in document['ingredients']]
+        display = {}
+        for kind, value in texts:
+            key = normalize(value).strip()
+            if key:
+                entry = (kind, key)
+                contributions[entry] = document['weight']
+                display[entry] = value.strip()
+
+        with self._lock:
+            self._display.update(display)
+            old = self._contributions.pop(recipe_id, {})
+            if contributions:
+                self._contributions[recipe_id] = contributions
+            for entry in set(old) | set(contributions):
+                weight = self.trie.weights.get(entry, 0) - old.get(entry, 0) + contributions.get(entry, 0)
+                self.trie.update(entry, tuple(dict.fromkeys(tokenize(entry[1]))), weight)
+                if weight <= 0:
+                    self._display.pop(entry, None)
+
+    def remove(self, recipe_id):
+        with self._lock:
+            for entry, contribution in self._contributions.pop(recipe_id, {}).items():
+                weight = self.trie.weights.get(entry, 0) - contribution
+                self.trie.update(entry, self.trie.words_of(entry), weight)
+                if weight <= 0:
+                    self._display.pop(entry, None)
+
+    def suggest(self, prefix, limit=10, kinds=None):
+        """[{'text', 'type', 'weight'}] для подсказки по началу слова.
+
+        Последнее слово - префикс, предыдущие должны встречаться целиком.
+        """
+        words = tokenize(prefix)
+        if not words:
+            return []
+        *complete, last = words
+        with self._lock:
+            node = self.trie.find(last)
+            if node is None:
+                return []
+            suggestions = []
+            for entry in node.top:
+                if kinds and entry[0] not in kinds:
+                    continue
+                if complete and not set(complete).issubset(self.trie.words_of(entry)):
+                    continue
+                suggestions.append({
+                    'text': self._display[entry],
+                    'type': entry[0],
+                    'weight': self.trie.weights[entry],
+                })
+                if len(suggestions) >= limit:
+                    break
+        return suggestions
+
+    def stats(self):
+        with self._lock:
+            return {
+                'recipes': len(self._contributions),
+                'suggestions': len(self.trie.weights),
+                'nodes': self.trie.nodes,
+                'memory_bytes': self.trie.memory_usage() + sys.getsizeof(self._display),
+            }
+
+
+class RecipeSuggestIndex(RecipeIndex):
+    """Подсказки /api/recipes/suggest из памяти процесса, обновляются событиями RecipeService.
+
+    Популярность (просмотры, лайки) меняется без событий - ее подтягивает
+    периодическая перестройка.
+    """
+
+    COLUMNS = ('id', 'title', 'category', 'ingredients', 'views', 'likes')
+
+    def create_index(self):
+        index = SuggestIndex(Config.RECIPE_SUGGEST_TOP_SIZE)
+        index.trie.deferred = True
+        return index
+
+    def finish_build(self, index):
+        index.trie.rebuild_tops()
+
+    def document(self, recipe):
+        return {
+            'title': recipe.title or '',
+            'category': recipe.category or '',
+            'ingredients': ingredient_names(recipe.ingredients),
+            'weight': 1 + (recipe.views or 0) + (recipe.likes or 0),
+        }
+
+    def suggest(self, prefix, limit=10, kinds=None):
+        return self.ensure_built().suggest(prefix, limit, kinds)
+
+
+recipe_suggestions = RecipeSuggestIndex(refresh_interval=Config.RECIPE_SEARCH_INDEX_REFRESH)
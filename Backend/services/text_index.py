@@ -0,0 +1,478 @@
+import json
+import math
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left, insort
+from config import Config
+from models.db import db
+from models.recipe import Recipe
+from services.pagination import paginate_ranked, iterate_ranked_chunks
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def normalize(value):
+    """Нижний регистр и ё -> е: 'Ёжики' и 'ежики' - одно слово"""
+    return (value or '').lower().replace('ё', 'е')
+
+
+def tokenize(value):
+    return TOKEN_RE.findall(normalize(value))
+
+
+def parse_ingredients(ingredients):
+    """[(name, amount, unit)] из JSON-колонки ingredients.
+
+    Новый формат - список {'name', 'amount', 'unit'}, старый - строка,
+    по ингредиенту на строку или через запятую (без количества).
+    """
+    if not ingredients:
+        return []
+    if isinstance(ingredients, str) and ingredients.lstrip().startswith('['):
+        # JSON-массив, сохраненный строкой (до перевода колонки в JSON)
+        try:
+            ingredients = json.loads(ingredients)
+        except ValueError:
+            pass
+    if isinstance(ingredients, str):
+        return [(part.strip(), None, None) for part in re.split(r'[\n,;]', ingredients) if part.strip()]
+    parsed = []
+    for item in ingredients:
+        if isinstance(item, dict):
+            name, amount, unit = item.get('name'), item.get('amount'), item.get('unit')
+        else:
+            name, amount, unit = item, None, None
+        if isinstance(name, str) and name.strip():
+            parsed.append((name.strip(), amount, unit))
+    return parsed
+
+
+def ingredient_names(ingredients):
+    """Названия ингредиентов из JSON-колонки"""
+    return [name for name, _, _ in parse_ingredients(ingredients)]
+
+
+def trigrams(term):
+    """Триграммы слова с отступами по краям, как в pg_trgm"""
+    padded = f'  {term} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """Триграммный индекс словаря: похожие термы без перебора всего словаря.
+
+    Сходство - как similarity() в pg_trgm: общие триграммы / все триграммы пары.
+    """
+
+    def __init__(self):
+        self._grams = {}       # триграмма -> термы
+        self._term_grams = {}  # терм -> его триграммы
+
+    def __len__(self):
+        return len(self._grams)
+
+    def add(self, term):
+        grams = frozenset(trigrams(term))
+        self._term_grams[term] = grams
+        for gram in grams:
+            self._grams.setdefault(gram, set()).add(term)
+
+    def remove(self, term):
+        for gram in self._term_grams.pop(term, ()):
+            terms = self._grams[gram]
+            terms.discard(term)
+            if not terms:
+                del self._grams[gram]
+
+    def similar(self, word, threshold):
+        """[(терм, сходство)] для термов со сходством не ниже threshold"""
+        grams = trigrams(word)
+        shared = {}
+        for gram in grams:
+            for term in self._grams.get(gram, ()):
+                shared[term] = shared.get(term, 0) + 1
+        matches = []
+        for term, count in shared.items():
+            similarity = count / (len(grams) + len(self._term_grams[term]) - count)
+            if similarity >= threshold:
+                matches.append((term, similarity))
+        return matches
+
+    def memory_usage(self):
+        size = sys.getsizeof(self._grams) + sys.getsizeof(self._term_grams)
+        for gram, terms in self._grams.items():
+            size += sys.getsizeof(gram) + sys.getsizeof(terms)
+        for grams in self._term_grams.values():
+            size += sys.getsizeof(grams)
+        return size
+
+
+class InvertedIndex:
+    """Инвертированный индекс с ранжированием BM25.
+
+    Документ - набор полей с весами (вхождение в название весит больше, чем
+    в ингредиенты). Словарь термов хранится и в dict (постинги), и в
+    отсортированном списке - для префиксных запросов через bisect.
+    """
+
+    def __init__(self, field_weights, k1=1.2, b=0.75):
+        self.field_weights = field_weights
+        self.k1 = k1
+        self.b = b
+        self._postings = {}   # term -> {doc_id: взвешенная частота}
+        self._doc_terms = {}  # doc_id -> термы документа (для удаления)
+        self._doc_len = {}
+        self._total_len = 0
+        self._terms = []      # отсортированный словарь
+        self.trigrams = TrigramIndex()  # для поиска с опечатками
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._doc_len)
+
+    def add(self, doc_id, fields):
+        """Добавить или заменить документ; fields - {поле: текст}"""
+        frequencies = {}
+        length = 0
+        for field, value in fields.items():
+            weight = self.field_weights.get(field, 1.0)
+            for term in tokenize(value):
+                frequencies[term] = frequencies.get(term, 0) + weight
+                length += weight
+
+        with self._lock:
+            self._remove(doc_id)
+            for term, frequency in frequencies.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = {}
+                    insort(self._terms, term)
+                    self.trigrams.add(term)
+                postings[doc_id] = frequency
+            self._doc_terms[doc_id] = tuple(frequencies)
+            self._doc_len[doc_id] = length
+            self._total_len += length
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self._total_len -= self._doc_len.pop(doc_id)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+                del self._terms[bisect_left(self._terms, term)]
+                self.trigrams.remove(term)
+
+    def expand(self, prefix):
+        """Термы словаря, начинающиеся с prefix"""
+        start = bisect_left(self._terms, prefix)
+        terms = []
+        for term in self._terms[start:]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    @staticmethod
+    def parse_query(query):
+        """'+курица рис* -лук' -> (обязательные, исключенные) списки (терм, префикс?).
+
+        Все слова без знака тоже обязательны (как в websearch_to_tsquery),
+        '-' исключает, '*' в конце - поиск по префиксу.
+        """
+        required, excluded = [], []
+        for word in (query or '').split():
+            target = required
+            if word[0] in '+-':
+                target = excluded if word[0] == '-' else required
+                word = word[1:]
+            is_prefix = word.endswith('*')
+            terms = tokenize(word)
+            for position, term in enumerate(terms):
+                target.append((term, is_prefix and position == len(terms) - 1))
+        return required, excluded
+
+    def _matching_terms(self, term, is_prefix):
+        if is_prefix:
+            return self.expand(term)
+        return [term] if term in self._postings else []
+
+    def search(self, query, limit=None):
+        """[(doc_id, score)] по убыванию BM25"""
+        required, excluded = self.parse_query(query)
+        if not required:
+            return []
+
+        with self._lock:
+            groups = [self._matching_terms(term, is_prefix) for term, is_prefix in required]
+            if not all(groups):
+                return []
+
+            # Кандидаты - пересечение, начиная с самой короткой группы постингов
+            candidate_sets = sorted(
+                (set().union(*(self._postings[term] for term in group)) for group in groups),
+                key=len
+            )
+            candidates = candidate_sets[0]
+            for doc_ids in candidate_sets[1:]:
+                candidates = candidates & doc_ids
+                if not candidates:
+                    return []
+            for term, is_prefix in excluded:
+                for matched in self._matching_terms(term, is_prefix):
+                    candidates = candidates - self._postings[matched].keys()
+
+            total_docs = len(self._doc_len)
+            avg_len = self._total_len / total_docs if total_docs else 1.0
+            scores = dict.fromkeys(candidates, 0.0)
+            for group in groups:
+                for term in group:
+                    postings = self._postings[term]
+                    idf = math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for doc_id in candidates.intersection(postings):
+                        frequency = postings[doc_id]
+                        norm = self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / avg_len)
+                        scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        return ranked[:limit] if limit is not None else ranked
+
+    def fuzzy_search(self, query, threshold, limit=None):
+        """[(doc_id, score)] с учетом опечаток: каждое слово запроса должно
+        найтись в документе хотя бы похожим термом, score - сумма лучших сходств
+        """
+        words = tokenize(query)
+        if not words:
+            return []
+
+        with self._lock:
+            best_by_word = []
+            for word in words:
+                best = {}
+                for term, similarity in self.trigrams.similar(word, threshold):
+                    for doc_id in self._postings[term]:
+                        if similarity > best.get(doc_id, 0.0):
+                            best[doc_id] = similarity
+                if not best:
+                    return []
+                best_by_word.append(best)
+
+        candidates = set(min(best_by_word, key=len))
+        for best in best_by_word:
+            candidates.intersection_update(best)
+        scores = {doc_id: sum(best[doc_id] for best in best_by_word) for doc_id in candidates}
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        return ranked[:limit] if limit is not None else ranked
+
+    def memory_usage(self):
+        """Приблизительный объем структур индекса в байтах (sys.getsizeof)"""
+        with self._lock:
+            size = sys.getsizeof(self._postings) + sys.getsizeof(self._terms)
+            size += sys.getsizeof(self._doc_terms) + sys.getsizeof(self._doc_len)
+            for term, postings in self._postings.items():
+                size += sys.getsizeof(term) + sys.getsizeof(postings)
+            for terms in self._doc_terms.values():
+                size += sys.getsizeof(terms)
+            size += self.trigrams.memory_usage()
+        return size
+
+    def stats(self):
+        with self._lock:
+            postings = sum(len(doc_ids) for doc_ids in self._postings.values())
+            return {
+                'documents': len(self._doc_len),
+                'terms': len(self._terms),
+                'postings': postings,
+                'trigrams': len(self.trigrams),
+                'memory_bytes': self.memory_usage(),
+            }
+
+
+class RecipeIndex:
+    """Основа индексов рецептов в памяти процесса.
+
+    Строится из таблицы recipes при старте, дальше поддерживается событиями
+    RecipeService (recipe_saved / recipe_deleted). Изменения, сделанные другими
+    воркерами, подтягиваются полной перестройкой раз в refresh_interval секунд
+    в фоновом потоке (start): запросы только читают готовый self.index.
+    Подклассы задают COLUMNS, create_index() и document(); сама структура
+    должна уметь add(recipe_id, document), remove(recipe_id) и stats().
+    """
+
+    COLUMNS = ('id', 'title', 'category', 'ingredients')
+
+    def __init__(self, refresh_interval=0):
+        self.refresh_interval = refresh_interval
+        self.index = None
+        self.built_at = None
+        self.build_seconds = None
+        self._build_lock = threading.Lock()
+        self._pending = None  # события, пришедшие во время перестройки
+        self._thread = None
+
+    def create_index(self):
+        raise NotImplementedError
+
+    def document(self, recipe):
+        """Документ индекса из Recipe или строки с колонками COLUMNS"""
+        raise NotImplementedError
+
+    def finish_build(self, index):
+        """Донастроить собранную структуру перед подменой (по умолчанию ничего)"""
+
+    def build(self):
+        """Полная перестройка из БД; новый индекс подменяет старый целиком"""
+        with self._build_lock:
+            return self._build()
+
+    def _build(self):
+        started = time.perf_counter()
+        self._pending = []
+        index = self.create_index()
+        rows = db.session.query(
+            *(getattr(Recipe, column) for column in self.COLUMNS)
+        ).yield_per(Config.RECIPES_STREAM_CHUNK_SIZE)
+        for row in rows:
+            index.add(row.id, self.document(row))
+        # Применяем то, что изменилось, пока читали таблицу
+        pending, self._pending = self._pending, None
+        for event in pending:
+            self._apply(index, *event)
+        self.finish_build(index)
+        self.index = index
+        self.built_at = time.monotonic()
+        self.build_seconds = time.perf_counter() - started
+        print(f"DEBUG: {type(self).__name__} built: {len(index)} recipes in {self.build_seconds:.3f}s")
+        return index
+
+    def _expired(self):
+        return bool(
+            self.refresh_interval
+            and self.built_at is not None
+            and time.monotonic() - self.built_at > self.refresh_interval
+        )
+
+    def start(self, app):
+        """Фоновая перестройка раз в refresh_interval секунд, как сброс просмотров в ViewCounter"""
+        if not self.refresh_interval or self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, args=(app,), name=f'{type(self).__name__}-refresh', daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, app):
+        while True:
+            time.sleep(self.refresh_interval)
+            if self.index is None:
+                continue  # индекс еще не понадобился ни одному запросу
+            try:
+                with app.app_context():
+                    self.build()
+            except Exception as e:
+                print(f"WARNING: {type(self).__name__} refresh failed: {e}")
+
+    def ensure_built(self):
+        index = self.index
+        if index is not None and (self._thread is not None or not self._expired()):
+            return index
+        # Первую сборку ждут все. Без фонового потока (скрипты) перестройку делает
+        # один запрос - остальные в это время отвечают по старому индексу
+        if not self._build_lock.acquire(blocking=index is None):
+            return index
+        try:
+            if self.index is None or self._expired():
+                self._build()
+            return self.index
+        finally:
+            self._build_lock.release()
+
+    @staticmethod
+    def _apply(index, action, recipe_id, document=None):
+        if action == 'saved':
+            index.add(recipe_id, document)
+        else:
+            index.remove(recipe_id)
+
+    def _record(self, *event):
+        if self._pending is not None:
+            self._pending.append(event)
+        if self.index is not None:
+            self._apply(self.index, *event)
+
+    # Слушатель RecipeService
+    def recipe_saved(self, recipe):
+        if self.index is None and self._pending is None:
+            return  # индекс еще не строился - событие ему не нужно
+        self._record('saved', recipe.id, self.document(recipe))
+
+    def recipe_deleted(self, recipe_id):
+        self._record('deleted', recipe_id)
+
+    def stats(self):
+        if self.index is None:
+            return {'built': False}
+        stats = self.index.stats()
+        stats.update({
+            'built': True,
+            'build_seconds': round(self.build_seconds, 4),
+            'age_seconds': round(time.monotonic() - self.built_at, 1),
+            'refresh_interval': self.refresh_interval,
+        })
+        return stats
+
+
+class RecipeSearchIndex(RecipeIndex):
+    """Поиск рецептов по индексу в памяти процесса (RECIPE_SEARCH_BACKEND=memory).
+
+    Ранжирование целиком в памяти, из БД читается только страница по id.
+    """
+
+    FIELD_WEIGHTS = {'title': 3.0, 'category': 2.0, 'ingredients': 1.0}
+
+    def create_index(self):
+        return InvertedIndex(self.FIELD_WEIGHTS)
+
+    def document(self, recipe):
+        return {
+            'title': recipe.title,
+            'category': recipe.category,
+            'ingredients': ' '.join(ingredient_names(recipe.ingredients)),
+        }
+
+    def search(self, query_text, cursor=None, limit=None, fields=None, stream=False):
+        """Как SearchService.search: (recipes, next_cursor) или (генератор пачек, None)"""
+        index = self.ensure_built()
+        if stream:
+            recipe_ids = [recipe_id for recipe_id, _ in index.search(query_text)]
+            return iterate_ranked_chunks(recipe_ids, fields), None
+        return paginate_ranked(
+            lambda offset, limit: index.search(query_text, offset + limit)[offset:],
+            cursor, limit, fields
+        )
+
+    def fuzzy_search(self, query_text, cursor=None, limit=None, fields=None, stream=False,
+                     threshold=None):
+        """Поиск с опечатками по триграммам словаря"""
+        index = self.ensure_built()
+        threshold = threshold if threshold is not None else Config.RECIPE_FUZZY_THRESHOLD
+        if stream:
+            recipe_ids = [recipe_id for recipe_id, _ in index.fuzzy_search(query_text, threshold)]
+            return iterate_ranked_chunks(recipe_ids, fields), None
+        return paginate_ranked(
+            lambda offset, limit: index.fuzzy_search(query_text, threshold, offset + limit)[offset:],
+            cursor, limit, fields, mode='fuzzy'
+        )
+
+
+# Один индекс на процесс (как recipe_cache)
+recipe_index = RecipeSearchIndex(refresh_interval=Config.RECIPE_SEARCH_INDEX_REFRESH)
@@ -0,0 +1,224 @@
+import atexit
+import threading
+from collections import Counter
+from sqlalchemy import bindparam, select
+from sqlalchemy.dialects.postgresql import insert as postgres_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from config import Config
+from models.db import db
+from models.recipe import Recipe, RecipeViewSketch
+from services.cache_service import recipe_cache
+from services.counter_service import counter_service
+from services.hyperloglog import HyperLogLog
+
+
+class ViewCounter:
+    """Буфер просмотров рецептов (write-behind).
+
+    Просмотр только увеличивает счетчик в памяти процесса; в БД накопленное
+    уходит пачкой UPDATE recipes SET views = views + n раз в flush_interval
+    секунд или как только в буфере набралось flush_threshold просмотров.
+    При штатной остановке воркера остаток сбрасывается из atexit. Счетчик
+    views в БД отстает от реального не больше чем на один интервал.
+
+    Уникальные зрители копятся так же: у рецепта в буфере HyperLogLog-скетч
+    зрителей с прошлого сброса, при сбросе он сливается со скетчем из
+    recipe_view_sketches, а оценка пишется в recipes.unique_views.
+    """
+
+    def __init__(self, flush_interval=5, flush_threshold=500, precision=12):
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.precision = precision
+        self.engine = None
+        self._pending = Counter()  # recipe_id -> просмотры, еще не записанные в БД
+        self._pending_total = 0
+        self._sketches = {}        # recipe_id -> HyperLogLog зрителей с прошлого сброса
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stats = {'views': 0, 'flushed_views': 0, 'flushed_sketches': 0, 'flushes': 0, 'errors': 0}
+
+    def start(self, app):
+        """Фоновый сброс по таймеру и при остановке процесса"""
+        with app.app_context():
+            self.engine = db.engine
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='view-counter', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def add(self, recipe_id, count=1, viewer=None):
+        """viewer - ключ зрителя (сессия или IP) для уникальных просмотров"""
+        with self._lock:
+            self._pending[recipe_id] += count
+            self._pending_total += count
+            self._stats['views'] += count
+            if viewer:
+                sketch = self._sketches.get(recipe_id)
+                if sketch is None:
+                    sketch = self._sketches[recipe_id] = HyperLogLog(self.precision)
+                sketch.add(viewer)
+            full = self._pending_total >= self.flush_threshold
+        if not full:
+            return
+        if self._thread is not None:
+            self._wake.set()
+        else:
+            # Без фонового потока (скрипты, тесты) сбрасываем сами
+            self.flush()
+
+    def pending(self, recipe_id):
+        """Просмотры рецепта, которые еще не попали в БД"""
+        with self._lock:
+            return self._pending.get(recipe_id, 0)
+
+    def unique_pending(self, recipe_id):
+        """Оценка зрителей рецепта с прошлого сброса (нижняя граница уникальных)"""
+        with self._lock:
+            sketch = self._sketches.get(recipe_id)
+            return sketch.count() if sketch is not None else 0
+
+    def _take(self):
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            sketches, self._sketches = self._sketches, {}
+            self._pending_total = 0
+            return pending, sketches
+
+    def _restore(self, pending, sketches):
+        with self._lock:
+            self._pending.update(pending)
+            self._pending_total += sum(pending.values())
+            for recipe_id, sketch in sketches.items():
+                current = self._sketches.get(recipe_id)
+                self._sketches[recipe_id] = sketch.merge(current) if current is not None else sketch
+
+    def _insert_ignore(self, connection, table):
+        """INSERT ... ON CONFLICT DO NOTHING для PostgreSQL и SQLite"""
+        if connection.dialect.name == 'postgresql':
+            return postgres_insert(table).on_conflict_do_nothing()
+        return sqlite_insert(table).on_conflict_do_nothing()
+
+    def _existing(self, connection, recipe_ids):
+        """Рецепты, которые еще есть в БД: удаленный после просмотра рецепт пропускаем"""
+        recipes = Recipe.__table__
+        query = select(recipes.c.id).where(recipes.c.id.in_(recipe_ids))
+        if connection.dialect.name == 'postgresql':
+            # Рецепт не удалят до конца транзакции - вставка скетча не нарушит внешний ключ
+            query = query.with_for_update(read=True, key_share=True)
+        return sorted(connection.execute(query).scalars())
+
+    def _merge_stored(self, connection, sketches, recipe_ids, counts):
+        """Слить скетчи с сохраненными строками; id, для которых строки еще нет"""
+        table = RecipeViewSketch.__table__
+        query = select(table.c.recipe_id, table.c.sketch).where(table.c.recipe_id.in_(recipe_ids))
+        if connection.dialect.name == 'postgresql':
+            # Другой воркер сливает те же скетчи - иначе одно из слияний потерялось бы
+            query = query.with_for_update()
+        stored = {row.recipe_id: HyperLogLog.from_bytes(row.sketch) for row in connection.execute(query)}
+
+        updates = []
+        for recipe_id, old in stored.items():
+            sketch = sketches[recipe_id]
+            if old.precision == sketch.precision:
+                # Копия: при ошибке транзакции в буфер вернется исходный скетч
+                sketch = HyperLogLog(sketch.precision, sketch.registers).merge(old)
+            updates.append({'sketch_recipe_id': recipe_id, 'data': sketch.to_bytes()})
+            counts[recipe_id] = sketch.count()
+        if updates:
+            connection.execute(
+                table.update().where(table.c.recipe_id == bindparam('sketch_recipe_id')).values(
+                    sketch=bindparam('data')
+                ),
+                updates
+            )
+        return [recipe_id for recipe_id in recipe_ids if recipe_id not in stored]
+
+    def _flush_sketches(self, connection, sketches):
+        """Слить скетчи буфера с сохраненными и обновить recipes.unique_views"""
+        table = RecipeViewSketch.__table__
+        counts = {}
+        missing = self._merge_stored(connection, sketches, self._existing(connection, sorted(sketches)), counts)
+        if missing:
+            rows = [{'recipe_id': recipe_id, 'sketch': sketches[recipe_id].to_bytes()} for recipe_id in missing]
+            statement = self._insert_ignore(connection, table).values(rows).returning(table.c.recipe_id)
+            inserted = set(connection.execute(statement).scalars())
+            for recipe_id in inserted:
+                counts[recipe_id] = sketches[recipe_id].count()
+            # Строку успел вставить другой воркер - сливаемся с ней, а не перезаписываем
+            conflicts = [recipe_id for recipe_id in missing if recipe_id not in inserted]
+            if conflicts:
+                self._merge_stored(connection, sketches, conflicts, counts)
+
+        if not counts:
+            return
+        recipes = Recipe.__table__
+        connection.execute(
+            recipes.update().where(recipes.c.id == bindparam('sketch_recipe_id')).values(
+                unique_views=bindparam('count'),
+                updated_at=recipes.c.updated_at
+            ),
+            [{'sketch_recipe_id': recipe_id, 'count': count} for recipe_id, count in sorted(counts.items())]
+        )
+
+    def flush(self):
+        """Записать накопленные просмотры одним executemany и скетчи зрителей; число записанных"""
+        with self._flush_lock:
+            pending, sketches = self._take()
+            if not pending and not sketches:
+                return 0
+            try:
+                engine = self.engine if self.engine is not None else db.engine
+                with engine.begin() as connection:
+                    # Просмотр не должен сдвигать Last-Modified/ETag - touch=False
+                    counter_service.increment_many('views', pending, connection, touch=False)
+                    if sketches:
+                        self._flush_sketches(connection, sketches)
+            except Exception as e:
+                # Не теряем просмотры: вернем в буфер до следующей попытки
+                self._restore(pending, sketches)
+                with self._lock:
+                    self._stats['errors'] += 1
+                print(f"WARNING: Failed to flush recipe views: {e}")
+                return 0
+            # В кэше рецепта views/unique_views еще до сброса, а буфер уже пуст -
+            # без инвалидации ответ показал бы меньше просмотров, чем до сброса
+            for recipe_id in pending:
+                recipe_cache.invalidate_recipe(recipe_id)
+            flushed = sum(pending.values())
+            with self._lock:
+                self._stats['flushed_views'] += flushed
+                self._stats['flushed_sketches'] += len(sketches)
+                self._stats['flushes'] += 1
+            return flushed
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'pending_views': self._pending_total,
+                'pending_recipes': len(self._pending),
+                'pending_sketches': len(self._sketches),
+                'sketch_bytes': len(self._sketches) * (1 << self.precision),
+                'flush_interval': self.flush_interval,
+                'flush_threshold': self.flush_threshold,
+                'background': self._thread is not None,
+            })
+        return stats
+
+
+# Один буфер на процесс, как recipe_cache
+view_counter = ViewCounter(
+    Config.RECIPE_VIEWS_FLUSH_INTERVAL,
+    Config.RECIPE_VIEWS_FLUSH_THRESHOLD,
+    Config.RECIPE_UNIQUE_VIEWS_PRECISION
+)
@@ -0,0 +1,25 @@
+import os
+import sys
+
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.db import db
+
+
+def create_app(database_url):
+    """Минимальное приложение для тестов сервисов: только БД, без маршрутов и фоновых потоков"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if database_url.startswith('sqlite'):
+        # Писатели SQLite ждут блокировку, а не падают с "database is locked"
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+    db.init_app(app)
+    return app
+
+
+def database_url(tmp_path, name):
+    """TEST_DATABASE_URL (postgresql://...) или файл SQLite во временной папке"""
+    return os.getenv('TEST_DATABASE_URL') or f'sqlite:///{tmp_path / name}'
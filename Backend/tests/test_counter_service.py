@@ -0,0 +1,123 @@
+"""Параллельные приращения CounterService не теряются: потоки и процессы.
+
+По умолчанию - файл SQLite во временной папке; TEST_DATABASE_URL
+(postgresql://...) прогоняет тот же тест на PostgreSQL.
+"""
+import multiprocessing
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import create_app, database_url
+from models.db import db
+from models.user import User
+from models.recipe import Recipe
+from services.counter_service import counter_service
+
+THREADS = 8
+PROCESSES = 4
+INCREMENTS = 25
+
+requires_fork = pytest.mark.skipif(
+    'fork' not in multiprocessing.get_all_start_methods(), reason='нужен fork'
+)
+
+
+def increment(app, recipe_id, count):
+    with app.app_context():
+        for _ in range(count):
+            counter_service.increment(recipe_id, 'likes')
+            db.session.commit()
+        db.session.remove()
+
+
+def increment_in_process(app, recipe_id, count):
+    # Соединения родителя после fork не переиспользуем
+    with app.app_context():
+        db.engine.dispose(close=False)
+    increment(app, recipe_id, count)
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app(database_url(tmp_path, 'counters.db'))
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = User(username='author', email='author@example.com')
+        user.set_password('secret')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Recipe(title='Блины', ingredients=[], instructions=[], author='author', author_id=user.id))
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+
+
+def recipe_likes(app):
+    with app.app_context():
+        return db.session.query(Recipe.likes).scalar()
+
+
+def recipe_id(app):
+    with app.app_context():
+        return db.session.query(Recipe.id).scalar()
+
+
+def test_threads_do_not_lose_increments(app):
+    threads = [
+        threading.Thread(target=increment, args=(app, recipe_id(app), INCREMENTS))
+        for _ in range(THREADS)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert recipe_likes(app) == THREADS * INCREMENTS
+
+
+@requires_fork
+def test_processes_do_not_lose_increments(app):
+    context = multiprocessing.get_context('fork')
+    processes = [
+        context.Process(target=increment_in_process, args=(app, recipe_id(app), INCREMENTS))
+        for _ in range(PROCESSES)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert all(process.exitcode == 0 for process in processes)
+    assert recipe_likes(app) == PROCESSES * INCREMENTS
+
+
+@requires_fork
+def test_threads_and_processes_together(app):
+    target = recipe_id(app)
+    context = multiprocessing.get_context('fork')
+    # Процессы стартуют до потоков: fork из многопоточного процесса небезопасен
+    processes = [
+        context.Process(target=increment_in_process, args=(app, target, INCREMENTS))
+        for _ in range(PROCESSES)
+    ]
+    for process in processes:
+        process.start()
+    threads = [threading.Thread(target=increment, args=(app, target, INCREMENTS)) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for process in processes:
+        process.join()
+
+    assert all(process.exitcode == 0 for process in processes)
+    assert recipe_likes(app) == (THREADS + PROCESSES) * INCREMENTS
@@ -0,0 +1,84 @@
+"""Параллельные toggle_favorite одного пользователя: без 500 и без расхождения счетчика."""
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import create_app, database_url
+from models.db import db
+from models.user import User, Favorite
+from models.recipe import Recipe
+from services.favorite_service import FavoriteService
+
+THREADS = 8
+TOGGLES = 10
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app(database_url(tmp_path, 'favorites.db'))
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = User(username='author', email='author@example.com')
+        user.set_password('secret')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Recipe(title='Блины', ingredients=[], instructions=[], author='author', author_id=user.id))
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+
+
+def ids(app):
+    with app.app_context():
+        return db.session.query(User.id).scalar(), db.session.query(Recipe.id).scalar()
+
+
+def favorite_state(app):
+    """(строк в favorites, recipes.favorites_count)"""
+    with app.app_context():
+        return Favorite.query.count(), db.session.query(Recipe.favorites_count).scalar()
+
+
+def test_concurrent_toggles_keep_count_in_sync(app):
+    user_id, recipe_id = ids(app)
+    results = []
+    start = threading.Barrier(THREADS)
+
+    def toggle():
+        with app.app_context():
+            start.wait()
+            for _ in range(TOGGLES):
+                results.append(FavoriteService().toggle_favorite(user_id, recipe_id))
+            db.session.remove()
+
+    threads = [threading.Thread(target=toggle) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert None not in results
+    rows, stored = favorite_state(app)
+    assert rows in (0, 1)
+    assert stored == rows
+
+
+def test_losing_insert_race_reports_favorite(app, monkeypatch):
+    user_id, recipe_id = ids(app)
+    service = FavoriteService()
+    with app.app_context():
+        assert service.toggle_favorite(user_id, recipe_id) is True
+        # Как будто строку вставил параллельный toggle уже после нашего DELETE
+        monkeypatch.setattr(service, '_delete', lambda user_id, recipe_id: 0)
+
+        assert service.toggle_favorite(user_id, recipe_id) is True
+
+    assert favorite_state(app) == (1, 1)
@@ -0,0 +1,59 @@
+"""Фильтр по ингредиентам у рецептов, добавленных в обход RecipeService.
+
+Так заполняют базу create_database.py и /api/init-db: recipe_ingredients
+появляются только после IngredientService.backfill().
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import create_app, database_url
+from models.db import db
+from models.user import User
+from models.recipe import Recipe
+from services.ingredient_service import IngredientService
+from services.recipe_filter import RecipeFilter
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app(database_url(tmp_path, 'ingredients.db'))
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = User(username='author', email='author@example.com')
+        user.set_password('secret')
+        db.session.add(user)
+        db.session.flush()
+        # Строка "название - количество" через запятую, как в create_database.py
+        db.session.add(Recipe(
+            title='Паста Карбонара',
+            ingredients='Спагетти - 400г, Бекон - 200г, Яйца - 3 шт, Пармезан - 100г',
+            instructions='1. Отварите спагетти.',
+            author='author',
+            author_id=user.id
+        ))
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+
+
+def filter_titles(include=None, exclude=None):
+    recipe_filter = RecipeFilter(include_ingredients=include, exclude_ingredients=exclude)
+    return [recipe.title for recipe in recipe_filter.apply(Recipe.query, IngredientService(), None)]
+
+
+def test_seeded_recipe_is_found_by_ingredient_after_backfill(app):
+    with app.app_context():
+        assert IngredientService().backfill() == 1
+
+        assert filter_titles(include=['бекон']) == ['Паста Карбонара']
+        assert filter_titles(include=['Бекон', 'яйца']) == ['Паста Карбонара']
+        assert filter_titles(include=['курица']) == []
+        assert filter_titles(exclude=['бекон']) == []
@@ -0,0 +1,70 @@
+"""RedisSessionStore на настоящем сервере Redis.
+
+Сервер берется из TEST_REDIS_URL (по умолчанию локальный, база 15); без
+пакета redis или без сервера тесты пропускаются.
+"""
+import os
+import sys
+import time
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.session_store import RedisSessionStore, create_session_store
+
+REDIS_URL = os.getenv('TEST_REDIS_URL', 'redis://localhost:6379/15')
+
+
+@pytest.fixture
+def prefix():
+    redis = pytest.importorskip('redis')
+    client = redis.Redis.from_url(REDIS_URL, socket_timeout=0.5)
+    try:
+        client.ping()
+    except redis.RedisError as e:
+        pytest.skip(f'Redis недоступен: {e}')
+    prefix = f'test-session:{uuid.uuid4().hex}:'
+    yield prefix
+    for key in client.scan_iter(f'{prefix}*'):
+        client.delete(key)
+
+
+def test_sessions_are_shared_between_workers(prefix):
+    # Два экземпляра - как два воркера gunicorn с одним сервером Redis
+    first = RedisSessionStore(REDIS_URL, ttl=60, prefix=prefix)
+    second = RedisSessionStore(REDIS_URL, ttl=60, prefix=prefix)
+
+    session_id = first.issue(42)
+
+    assert second.get(session_id) == 42
+    second.delete(session_id)
+    assert first.get(session_id) is None
+
+
+def test_unknown_session(prefix):
+    store = RedisSessionStore(REDIS_URL, ttl=60, prefix=prefix)
+
+    assert store.get(str(uuid.uuid4())) is None
+
+
+def test_session_expires_with_ttl(prefix):
+    store = RedisSessionStore(REDIS_URL, ttl=1, prefix=prefix)
+    session_id = store.issue(7)
+
+    assert store.client.ttl(store._key(session_id)) <= 1
+    time.sleep(1.5)
+    assert store.get(session_id) is None
+
+
+def test_unreachable_redis_is_a_startup_error():
+    pytest.importorskip('redis')
+
+    class UnreachableRedis:
+        SESSION_BACKEND = 'redis'
+        SESSION_REDIS_URL = 'redis://127.0.0.1:1/0'
+        SESSION_TTL = 60
+
+    with pytest.raises(RuntimeError):
+        create_session_store(UnreachableRedis)
@@ -0,0 +1,191 @@
+# Backend/upgrade_db.py
+# Обновление схемы существующей БД (PostgreSQL или SQLite) без потери данных.
+# Запуск: python upgrade_db.py  (DATABASE_URL берется из окружения, как в app.py)
+import json
+from sqlalchemy import text, bindparam, inspect
+from app import app
+from models.db import db
+from models.recipe import JSONType
+from services.search_service import SearchService
+from services.ingredient_service import IngredientService
+from services.rating_service import RatingService
+from services.favorite_service import FavoriteService
+
+BATCH_SIZE = 500
+
+
+def add_pagination_indexes():
+    """Индексы под keyset-пагинацию и версию коллекции, заполнение пустых created_at"""
+    # Курсор строится по (created_at, id), поэтому NULL в created_at недопустим
+    result = db.session.execute(text(
+        "UPDATE recipes SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL"
+    ))
+    print(f"✓ created_at заполнен у {result.rowcount} рецептов")
+
+    db.session.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_recipes_created_at_id ON recipes (created_at, id)"
+    ))
+    db.session.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_recipes_author_id_created_at "
+        "ON recipes (author_id, created_at, id)"
+    ))
+    db.session.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_recipes_updated_at ON recipes (updated_at)"
+    ))
+    db.session.commit()
+    print("✓ Индексы пагинации созданы")
+
+
+def add_filter_indexes():
+    """Индексы под частые условия /api/recipes/filter"""
+    db.session.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_recipes_category_created_at "
+        "ON recipes (category, created_at, id)"
+    ))
+    db.session.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_recipes_cooking_time ON recipes (cooking_time)"
+    ))
+    db.session.commit()
+    print("✓ Индексы фильтров созданы")
+
+
+def _legacy_json_value(value):
+    """Значение из старой TEXT-колонки: JSON-массив/объект разбираем, остальное - строка"""
+    if isinstance(value, str) and value.strip()[:1] in ('[', '{'):
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
+    return value
+
+
+def migrate_json_columns():
+    """ingredients/instructions: TEXT -> JSONB (PostgreSQL) / JSON (SQLite) с переносом данных"""
+    columns = {col['name']: col for col in inspect(db.engine).get_columns('recipes')}
+    if isinstance(columns['ingredients']['type'], db.JSON):
+        print("✓ ingredients/instructions уже JSON")
+        return
+
+    is_postgres = db.engine.dialect.name == 'postgresql'
+    json_sql_type = 'JSONB' if is_postgres else 'JSON'
+    db.session.execute(text(f"ALTER TABLE recipes ADD COLUMN ingredients_json {json_sql_type}"))
+    db.session.execute(text(f"ALTER TABLE recipes ADD COLUMN instructions_json {json_sql_type}"))
+    db.session.commit()
+
+    update = text(
+        "UPDATE recipes SET ingredients_json = :ingredients, instructions_json = :instructions "
+        "WHERE id = :id"
+    ).bindparams(
+        bindparam('ingredients', type_=JSONType),
+        bindparam('instructions', type_=JSONType)
+    )
+
+    # Переносим пачками по id, чтобы не держать всю таблицу в памяти и долгих блокировок
+    last_id = 0
+    migrated = 0
+    while True:
+        rows = db.session.execute(text(
+            "SELECT id, ingredients, instructions FROM recipes "
+            "WHERE id > :last_id ORDER BY id LIMIT :limit"
+        ), {'last_id': last_id, 'limit': BATCH_SIZE}).fetchall()
+        if not rows:
+            break
+        db.session.execute(update, [
+            {
+                'id': row.id,
+                'ingredients': _legacy_json_value(row.ingredients) or '',
+                'instructions': _legacy_json_value(row.instructions),
+            }
+            for row in rows
+        ])
+        db.session.commit()
+        last_id = rows[-1].id
+        migrated += len(rows)
+        print(f"  перенесено {migrated} рецептов...")
+
+    db.session.execute(text("ALTER TABLE recipes DROP COLUMN ingredients"))
+    db.session.execute(text("ALTER TABLE recipes DROP COLUMN instructions"))
+    db.session.execute(text("ALTER TABLE recipes RENAME COLUMN ingredients_json TO ingredients"))
+    db.session.execute(text("ALTER TABLE recipes RENAME COLUMN instructions_json TO instructions"))
+    if is_postgres:
+        db.session.execute(text("ALTER TABLE recipes ALTER COLUMN ingredients SET NOT NULL"))
+    db.session.commit()
+    print(f"✓ ingredients/instructions переведены в {json_sql_type} ({migrated} рецептов)")
+
+
+def create_fulltext_index():
+    """tsvector + GIN и pg_trgm (PostgreSQL) или FTS5 с триггерами (SQLite) для поиска"""
+    SearchService().ensure_index()
+    print("✓ Полнотекстовый индекс рецептов создан")
+
+
+def backfill_recipe_ingredients():
+    """Разобрать ингредиенты существующих рецептов в ingredients / recipe_ingredients"""
+    synced = IngredientService().backfill(BATCH_SIZE)
+    print(f"✓ Ингредиенты нормализованы ({synced} рецептов)")
+
+
+def add_rating_aggregates():
+    """rating_sum и гистограмма rating_1..rating_5, заполненные из ratings"""
+    columns = {col['name'] for col in inspect(db.engine).get_columns('recipes')}
+    for column in ['rating_sum'] + [f'rating_{stars}' for stars in range(1, 6)]:
+        if column not in columns:
+            db.session.execute(text(f"ALTER TABLE recipes ADD COLUMN {column} INTEGER DEFAULT 0"))
+    db.session.commit()
+    updated = RatingService().backfill(BATCH_SIZE)
+    print(f"✓ Агрегаты оценок пересчитаны ({updated} рецептов)")
+
+
+def add_favorites_count():
+    """Колонка recipes.favorites_count, заполненная из favorites, и индекс favorites.recipe_id"""
+    columns = {col['name'] for col in inspect(db.engine).get_columns('recipes')}
+    if 'favorites_count' not in columns:
+        db.session.execute(text("ALTER TABLE recipes ADD COLUMN favorites_count INTEGER DEFAULT 0"))
+    db.session.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_favorites_recipe_id ON favorites (recipe_id)"
+    ))
+    db.session.commit()
+    updated = FavoriteService().backfill(BATCH_SIZE)
+    print(f"✓ Счетчики избранного пересчитаны ({updated} рецептов)")
+
+
+def add_counter_indexes():
+    """Индексы по recipe_id для пересчета comments_count и агрегатов оценок"""
+    db.session.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_comments_recipe_id ON comments (recipe_id, created_at)"
+    ))
+    db.session.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_ratings_recipe_id ON ratings (recipe_id, rating)"
+    ))
+    db.session.commit()
+    print("✓ Индексы счетчиков созданы")
+
+
+def add_unique_views():
+    """recipes.unique_views; таблица recipe_view_sketches создается в create_all"""
+    columns = {col['name'] for col in inspect(db.engine).get_columns('recipes')}
+    if 'unique_views' not in columns:
+        db.session.execute(text("ALTER TABLE recipes ADD COLUMN unique_views INTEGER DEFAULT 0"))
+    db.session.commit()
+    print("✓ Колонка unique_views добавлена")
+
+
+def main():
+    with app.app_context():
+        print(f"Диалект БД: {db.engine.dialect.name}")
+        # Создаем недостающие таблицы (существующие не трогаются)
+        db.create_all()
+        add_pagination_indexes()
+        migrate_json_columns()
+        create_fulltext_index()
+        backfill_recipe_ingredients()
+        add_filter_indexes()
+        add_rating_aggregates()
+        add_favorites_count()
+        add_counter_indexes()
+        add_unique_views()
+        print("\n✅ Схема обновлена")
+
+
+if __name__ == '__main__':
+    main()